@@ -0,0 +1,206 @@
+import io
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+from sqlalchemy import func
+from .database import SessionLocal
+from .models import AIAnalysisCache
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it keys use the raw upload bytes
+    Image = None
+
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+AI_CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Max Hamming distance between perceptual hashes for a near-duplicate hit; -1 disables
+AI_CACHE_NEAR_DUPLICATE_DISTANCE = int(os.getenv("AI_CACHE_NEAR_DUPLICATE_DISTANCE", "-1"))
+
+def _open_image(image_bytes: bytes):
+    if Image is None:
+        return None
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+        return image
+    except Exception:
+        return None
+
+def normalized_image_digest(image_bytes: bytes) -> str:
+    """sha256 of the decoded pixels, so re-saved files with different metadata
+    share a key. Falls back to the raw bytes when the image can't be decoded."""
+    image = _open_image(image_bytes)
+    if image is None:
+        return hashlib.sha256(image_bytes).hexdigest()
+    image = image.convert("RGB")
+    digest = hashlib.sha256(f"{image.width}x{image.height}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def perceptual_hash(image_bytes: bytes) -> Optional[str]:
+    """64-bit difference hash (dHash) as 16 hex chars, or None without Pillow."""
+    image = _open_image(image_bytes)
+    if image is None:
+        return None
+    pixels = list(image.convert("L").resize((9, 8)).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+def _hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+class AnalysisCache:
+    """Persistent cache of vision results keyed by image content, prompt and model.
+
+    Entries expire after ttl_seconds and the least recently used ones are
+    evicted once the stored results exceed max_bytes.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_bytes: int = AI_CACHE_MAX_BYTES,
+                 ttl_seconds: int = AI_CACHE_TTL_SECONDS,
+                 near_duplicate_distance: int = AI_CACHE_NEAR_DUPLICATE_DISTANCE):
+        self.session_factory = session_factory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicate_distance = near_duplicate_distance
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(image_digest: str, prompt: str, model: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        return hashlib.sha256(f"{image_digest}:{prompt_hash}:{model}".encode()).hexdigest()
+
+    def get(self, image_bytes: bytes, prompt: str, model: str) -> Optional[dict]:
+        key = self.make_key(normalized_image_digest(image_bytes), prompt, model)
+        now = time.time()
+        db = self.session_factory()
+        try:
+            entry = db.get(AIAnalysisCache, key)
+            if entry is not None and entry.created_at < now - self.ttl_seconds:
+                db.delete(entry)
+                entry = None
+            near = False
+            if entry is None and self.near_duplicate_distance >= 0:
+                entry = self._find_near_duplicate(db, image_bytes, prompt, model, now)
+                near = entry is not None
+            if entry is None:
+                db.commit()
+                self._count("misses")
+                return None
+
+            entry.last_accessed_at = now
+            result = entry.result
+            db.commit()
+            self._count("near_hits" if near else "hits")
+            return result
+        finally:
+            db.close()
+
+    def put(self, image_bytes: bytes, prompt: str, model: str, result: dict):
+        key = self.make_key(normalized_image_digest(image_bytes), prompt, model)
+        now = time.time()
+        db = self.session_factory()
+        try:
+            db.merge(AIAnalysisCache(
+                key=key,
+                model=model,
+                prompt_hash=hashlib.sha256(prompt.encode()).hexdigest(),
+                perceptual_hash=perceptual_hash(image_bytes),
+                result=result,
+                size_bytes=len(json.dumps(result)),
+                created_at=now,
+                last_accessed_at=now,
+            ))
+            db.flush()
+            self._evict(db, now)
+            db.commit()
+        finally:
+            db.close()
+
+    def record_bypass(self):
+        self._count("bypassed")
+
+    def stats(self) -> dict:
+        db = self.session_factory()
+        try:
+            entries, size = db.query(
+                func.count(AIAnalysisCache.key), func.coalesce(func.sum(AIAnalysisCache.size_bytes), 0)
+            ).one()
+        finally:
+            db.close()
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.near_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+    def _find_near_duplicate(self, db, image_bytes, prompt, model, now):
+        phash = perceptual_hash(image_bytes)
+        if phash is None:
+            return None
+        candidates = (
+            db.query(AIAnalysisCache)
+            .filter(
+                AIAnalysisCache.model == model,
+                AIAnalysisCache.prompt_hash == hashlib.sha256(prompt.encode()).hexdigest(),
+                AIAnalysisCache.perceptual_hash.isnot(None),
+                AIAnalysisCache.created_at >= now - self.ttl_seconds,
+            )
+        )
+        best, best_distance = None, self.near_duplicate_distance + 1
+        for candidate in candidates:
+            distance = _hamming(phash, candidate.perceptual_hash)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    def _evict(self, db, now):
+        expired = db.query(AIAnalysisCache).filter(AIAnalysisCache.created_at < now - self.ttl_seconds)
+        evicted = expired.delete()
+
+        total = db.query(func.coalesce(func.sum(AIAnalysisCache.size_bytes), 0)).scalar()
+        if total > self.max_bytes:
+            oldest = (
+                db.query(AIAnalysisCache.key, AIAnalysisCache.size_bytes)
+                .order_by(AIAnalysisCache.last_accessed_at)
+                .all()
+            )
+            stale_keys = []
+            for key, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                stale_keys.append(key)
+                total -= size
+            evicted += db.query(AIAnalysisCache).filter(
+                AIAnalysisCache.key.in_(stale_keys)
+            ).delete(synchronize_session=False)
+
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+analysis_cache = AnalysisCache()
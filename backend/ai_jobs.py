@@ -0,0 +1,104 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .ai_service import AIService
+
+AI_MAX_WORKERS = int(os.getenv("AI_MAX_WORKERS", "4"))
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "32"))
+AI_JOB_TTL_SECONDS = int(os.getenv("AI_JOB_TTL_SECONDS", "3600"))
+
+class QueueFullError(Exception):
+    pass
+
+class AnalysisJobQueue:
+    """Runs image analyses on a bounded worker pool.
+
+    Jobs are kept in memory (per process) until AI_JOB_TTL_SECONDS after they
+    finish. Submitting while AI_MAX_QUEUE jobs are still waiting raises
+    QueueFullError instead of growing the backlog without limit.
+    """
+
+    def __init__(self, max_workers: int = AI_MAX_WORKERS, max_queue: int = AI_MAX_QUEUE,
+                 ttl_seconds: int = AI_JOB_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-analysis")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, image_bytes: bytes, mime_type: str, use_cache: bool = True,
+               preprocessing: dict = None) -> dict:
+        with self._lock:
+            self._purge_expired()
+            if self._count("queued") >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError("Image analysis queue is full")
+            job = {
+                "id": uuid.uuid4().hex,
+                "status": "queued",
+                "result": None,
+                "error": None,
+                "preprocessing": preprocessing,
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+            self._jobs[job["id"]] = job
+        self._executor.submit(self._run, job["id"], image_bytes, mime_type, use_cache)
+        return self.get(job["id"])
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {key: value for key, value in job.items() if key != "created_at"}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._count("queued"),
+                "running": self._count("running"),
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+    def _run(self, job_id: str, image_bytes: bytes, mime_type: str, use_cache: bool):
+        with self._lock:
+            self._jobs[job_id]["status"] = "running"
+
+        result = AIService.analyze_image(image_bytes, mime_type, use_cache)
+
+        with self._lock:
+            job = self._jobs[job_id]
+            if "error" in result:
+                job["status"] = "failed"
+                job["error"] = result["error"]
+                self.failed += 1
+            else:
+                job["status"] = "done"
+                job["result"] = result
+                self.completed += 1
+            job["finished_at"] = time.time()
+
+    def _count(self, status: str) -> int:
+        return sum(1 for job in self._jobs.values() if job["status"] == status)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+analysis_jobs = AnalysisJobQueue()
@@ -1,8 +1,14 @@
 import os
 import json
+import base64
+import threading
+import time
+from functools import lru_cache
 import openai
 from dotenv import load_dotenv
 from typing import Optional
+from .ai_cache import AI_CACHE_ENABLED, analysis_cache
+from .metrics import AI_ANALYSIS_DURATION, AI_TOKENS
 
 load_dotenv()
 
@@ -10,64 +16,129 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 if API_KEY:
     openai.api_key = API_KEY
 
-class AIService:
-    @staticmethod
-    def analyze_image(image_bytes: bytes, mime_type: str = "image/jpeg") -> dict:
-        if not API_KEY:
-            # Fallback mock response if no key
-            return {
-                "name": "Mock AI Recipe (No Key)",
-                "ingredients": [
-                    {"name": "Chicken Breast", "quantity": 150, "unit": "g", "confidence": 0.9},
-                    {"name": "Rice", "quantity": 200, "unit": "g", "confidence": 0.85}
-                ],
-                "nutrition_estimate": {
-                    "energy_kcal": 450,
-                    "protein_g": 35,
-                    "carbs_g": 50,
-                    "fat_g": 5
-                }
+AI_MODEL = os.getenv("AI_MODEL", "gpt-4o")
+# "openai" or "fake"; defaults to the fake provider when no key is configured
+AI_PROVIDER = os.getenv("AI_PROVIDER", "openai" if API_KEY else "fake")
+
+PROMPT_PATH = os.path.join(os.path.dirname(__file__), "prompts", "image_analysis.md")
+
+@lru_cache(maxsize=1)
+def load_prompt() -> str:
+    try:
+        with open(PROMPT_PATH, "r") as f:
+            return f.read()
+    except FileNotFoundError:
+         # Fallback if file missing
+         return """
+         You are a precise food analyst. Given a meal photo, output JSON only with the following structure:
+         ... (fallback text)
+         """
+
+class FakeVisionProvider:
+    """Offline provider returning a canned draft; used without an API key and in tests."""
+    name = "fake"
+    model = "fake"
+
+    def __init__(self, response: Optional[dict] = None, delay_seconds: float = 0.0):
+        self.response = response
+        self.delay_seconds = delay_seconds
+
+    def analyze(self, image_bytes: bytes, mime_type: str) -> dict:
+        if self.delay_seconds:
+            threading.Event().wait(self.delay_seconds)
+        if self.response is not None:
+            return self.response
+        return {
+            "name": "Mock AI Recipe (No Key)",
+            "ingredients": [
+                {"name": "Chicken Breast", "quantity": 150, "unit": "g", "confidence": 0.9},
+                {"name": "Rice", "quantity": 200, "unit": "g", "confidence": 0.85}
+            ],
+            "nutrition_estimate": {
+                "energy_kcal": 450,
+                "protein_g": 35,
+                "carbs_g": 50,
+                "fat_g": 5
             }
+        }
 
-        client = openai.OpenAI(api_key=API_KEY)
-        
-        # Load prompt from file
-        try:
-            with open(os.path.join(os.path.dirname(__file__), "prompts", "image_analysis.md"), "r") as f:
-                prompt = f.read()
-        except FileNotFoundError:
-             # Fallback if file missing
-             prompt = """
-             You are a precise food analyst. Given a meal photo, output JSON only with the following structure:
-             ... (fallback text)
-             """
+class OpenAIVisionProvider:
+    name = "openai"
 
-        try:
-            import base64
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-            
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:{mime_type};base64,{base64_image}"
-                                }
+    def __init__(self, api_key: str, model: str = AI_MODEL):
+        self.model = model
+        # The client keeps a pooled HTTP connection, so build it once per process
+        self.client = openai.OpenAI(api_key=api_key)
+
+    def analyze(self, image_bytes: bytes, mime_type: str) -> dict:
+        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": load_prompt()},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{base64_image}"
                             }
-                        ]
-                    }
-                ],
-                response_format={ "type": "json_object" }
-            )
-            
-            content = response.choices[0].message.content
-            return json.loads(content)
+                        }
+                    ]
+                }
+            ],
+            response_format={ "type": "json_object" }
+        )
+
+        if response.usage:
+            AI_TOKENS.inc(response.usage.prompt_tokens, model=self.model, kind="prompt")
+            AI_TOKENS.inc(response.usage.completion_tokens, model=self.model, kind="completion")
+
+        content = response.choices[0].message.content
+        return json.loads(content)
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if AI_PROVIDER == "openai" and API_KEY:
+                    _provider = OpenAIVisionProvider(API_KEY)
+                else:
+                    _provider = FakeVisionProvider()
+    return _provider
+
+def set_provider(provider):
+    """Swap the vision provider, e.g. for a FakeVisionProvider in tests."""
+    global _provider
+    _provider = provider
+
+class AIService:
+    @staticmethod
+    def analyze_image(image_bytes: bytes, mime_type: str = "image/jpeg", use_cache: bool = True) -> dict:
+        provider = get_provider()
+        use_cache = use_cache and AI_CACHE_ENABLED
+        if use_cache:
+            cached = analysis_cache.get(image_bytes, load_prompt(), provider.model)
+            if cached is not None:
+                return cached
+        else:
+            analysis_cache.record_bypass()
+
+        started = time.perf_counter()
+        try:
+            result = provider.analyze(image_bytes, mime_type)
         except Exception as e:
+            AI_ANALYSIS_DURATION.observe(time.perf_counter() - started, provider=provider.name, outcome="error")
             print(f"AI Error: {e}")
             return {"error": str(e)}
+        AI_ANALYSIS_DURATION.observe(time.perf_counter() - started, provider=provider.name, outcome="ok")
 
+        if use_cache and "error" not in result:
+            analysis_cache.put(image_bytes, load_prompt(), provider.model, result)
+        return result
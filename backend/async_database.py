@@ -0,0 +1,53 @@
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from .database import (
+    SQLALCHEMY_DATABASE_URL, SQLITE_BUSY_TIMEOUT_MS, SQLITE_TUNING,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, _apply_sqlite_pragmas
+)
+
+# Serve the recipe, ingredient and log endpoints from async handlers
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_database_url(url: str = SQLALCHEMY_DATABASE_URL) -> str:
+    """Swap a sync driver for its async counterpart (aiosqlite / asyncpg)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.get_driver_name() in ("aiosqlite", "asyncpg") or backend not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+def create_async_db_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    url = async_database_url(url)
+    if make_url(url).get_backend_name() != "sqlite":
+        return create_async_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+
+    async_engine = create_async_engine(url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+    if SQLITE_TUNING:
+        event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return async_engine
+
+_async_engine = None
+_async_session_factory = None
+
+def get_async_session_factory():
+    # Built on first use so the sync-only deployment never needs aiosqlite/asyncpg
+    global _async_engine, _async_session_factory
+    if _async_session_factory is None:
+        _async_engine = create_async_db_engine()
+        _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
+async def get_async_db():
+    async with get_async_session_factory()() as db:
+        yield db
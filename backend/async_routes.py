@@ -0,0 +1,143 @@
+"""Async handlers for the recipe, ingredient and log endpoints.
+
+main.py registers this router ahead of the sync handlers when DB_ASYNC=true,
+so the same paths are served from the event loop with an AsyncSession.
+"""
+import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from .async_database import get_async_db
+from .async_services import AsyncRecipeService, AsyncIngredientService, AsyncLogService, AsyncCatalogService
+from .http_cache import catalog_headers, not_modified
+from .entry_stream import async_stream_entries
+from .users import get_user_id
+from .models import RecipeType
+from .schemas import (
+    RecipeCreate, Recipe, RecipeIngredientsPatch, IngredientCreate, Ingredient, FoodEntryCreate, FoodEntry,
+    FoodEntryBatchResult, DailySummary, parse_recipe_fields, dump_recipes
+)
+
+router = APIRouter()
+
+@router.post("/ingredients", response_model=Ingredient)
+async def create_ingredient(ingredient: IngredientCreate, db: AsyncSession = Depends(get_async_db)):
+    return await AsyncIngredientService.create_ingredient(db, ingredient)
+
+@router.put("/ingredients/{ingredient_id}", response_model=Ingredient)
+async def update_ingredient(ingredient_id: int, ingredient: IngredientCreate, db: AsyncSession = Depends(get_async_db)):
+    db_ingredient = await AsyncIngredientService.update_ingredient(db, ingredient_id, ingredient)
+    if not db_ingredient:
+        raise HTTPException(status_code=404, detail="Ingredient not found")
+    return db_ingredient
+
+@router.get("/ingredients", response_model=List[Ingredient])
+async def list_ingredients(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                           db: AsyncSession = Depends(get_async_db)):
+    headers = catalog_headers(await AsyncCatalogService.current(db))
+    if cached := not_modified(request, headers):
+        return cached
+    response.headers.update(headers)
+    return await AsyncIngredientService.list_ingredients(db, skip, limit)
+
+@router.post("/recipes", response_model=Recipe)
+async def create_recipe(recipe: RecipeCreate, user_id: int = Depends(get_user_id),
+                        db: AsyncSession = Depends(get_async_db)):
+    return await AsyncRecipeService.create_recipe(db, recipe, user_id)
+
+@router.get("/recipes")
+async def list_recipes(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    name_prefix: Optional[str] = None,
+    type: Optional[RecipeType] = None,
+    summary: bool = False,
+    fields: Optional[str] = None,
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        include = parse_recipe_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = catalog_headers(await AsyncCatalogService.current(db), user_id)
+    if cached := not_modified(request, headers):
+        return cached
+    response.headers.update(headers)
+
+    with_ingredients = not summary and (include is None or "ingredients" in include)
+    recipes, next_cursor = await AsyncRecipeService.list_recipes(
+        db, user_id, cursor=cursor, limit=limit, name_prefix=name_prefix,
+        recipe_type=type, with_ingredients=with_ingredients
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return dump_recipes(recipes, summary, include)
+
+@router.get("/recipes/{recipe_id}", response_model=Recipe)
+async def get_recipe(recipe_id: int, request: Request, response: Response,
+                     user_id: int = Depends(get_user_id), db: AsyncSession = Depends(get_async_db)):
+    headers = catalog_headers(await AsyncCatalogService.current(db), user_id)
+    # Checked before the ETag, so a missing or another user's recipe is a 404
+    recipe = await AsyncRecipeService.get_recipe(db, recipe_id, user_id)
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    if cached := not_modified(request, headers):
+        return cached
+    response.headers.update(headers)
+    return recipe
+
+@router.put("/recipes/{recipe_id}", response_model=Recipe)
+async def update_recipe(recipe_id: int, recipe: RecipeCreate, user_id: int = Depends(get_user_id),
+                        db: AsyncSession = Depends(get_async_db)):
+    db_recipe = await AsyncRecipeService.get_recipe(db, recipe_id, user_id)
+    if not db_recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return await AsyncRecipeService.update_recipe(db, db_recipe, recipe)
+
+@router.patch("/recipes/{recipe_id}/ingredients", response_model=Recipe)
+async def patch_recipe_ingredients(recipe_id: int, changes: RecipeIngredientsPatch,
+                                   user_id: int = Depends(get_user_id), db: AsyncSession = Depends(get_async_db)):
+    db_recipe = await AsyncRecipeService.get_recipe(db, recipe_id, user_id)
+    if not db_recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    if db_recipe.type != RecipeType.GRANULAR:
+        raise HTTPException(status_code=400, detail="Only granular recipes have ingredients")
+    return await AsyncRecipeService.patch_ingredients(db, db_recipe, changes)
+
+@router.post("/log", response_model=FoodEntry)
+async def log_food(entry: FoodEntryCreate, user_id: int = Depends(get_user_id),
+                   db: AsyncSession = Depends(get_async_db)):
+    db_entry = await AsyncLogService.create_entry(db, entry, user_id)
+    if not db_entry:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return db_entry
+
+@router.post("/log/batch", response_model=FoodEntryBatchResult)
+async def log_food_batch(entries: List[FoodEntryCreate], user_id: int = Depends(get_user_id),
+                         db: AsyncSession = Depends(get_async_db)):
+    return await AsyncLogService.create_entries(db, entries, user_id)
+
+@router.get("/log", response_model=List[FoodEntry])
+async def get_log(
+    date: Optional[datetime.date] = None,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    stream: bool = False,
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if stream:
+        return StreamingResponse(async_stream_entries(user_id, date, start, end), media_type="application/x-ndjson")
+    return await AsyncLogService.list_entries(db, user_id, date, start, end)
+
+@router.get("/log/summary", response_model=DailySummary)
+async def get_log_summary(date: datetime.date, user_id: int = Depends(get_user_id),
+                          db: AsyncSession = Depends(get_async_db)):
+    return await AsyncLogService.get_daily_summary(db, user_id, date)
@@ -0,0 +1,74 @@
+"""Async counterparts of the service layer for AsyncSession.
+
+Business logic lives once, in services.py: each method runs the sync
+implementation through AsyncSession.run_sync, which drives the async driver
+from a greenlet, so handlers never block the event loop on database I/O.
+"""
+from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Recipe
+from .schemas import RecipeCreate, RecipeIngredientsPatch, IngredientCreate, FoodEntryCreate
+from .services import RecipeService, IngredientService, LogService, CatalogService, STREAM_BATCH_SIZE
+
+class AsyncCatalogService:
+    @staticmethod
+    async def current(db: AsyncSession):
+        return await db.run_sync(CatalogService.current)
+
+class AsyncIngredientService:
+    @staticmethod
+    async def create_ingredient(db: AsyncSession, ingredient: IngredientCreate):
+        return await db.run_sync(IngredientService.create_ingredient, ingredient)
+
+    @staticmethod
+    async def update_ingredient(db: AsyncSession, ingredient_id: int, ingredient: IngredientCreate):
+        return await db.run_sync(IngredientService.update_ingredient, ingredient_id, ingredient)
+
+    @staticmethod
+    async def list_ingredients(db: AsyncSession, skip: int = 0, limit: int = 100):
+        return await db.run_sync(IngredientService.list_ingredients, skip, limit)
+
+class AsyncRecipeService:
+    @staticmethod
+    async def create_recipe(db: AsyncSession, recipe: RecipeCreate, user_id: int):
+        return await db.run_sync(RecipeService.create_recipe, recipe, user_id)
+
+    @staticmethod
+    async def update_recipe(db: AsyncSession, db_recipe: Recipe, recipe: RecipeCreate):
+        return await db.run_sync(RecipeService.update_recipe, db_recipe, recipe)
+
+    @staticmethod
+    async def patch_ingredients(db: AsyncSession, db_recipe: Recipe, changes: RecipeIngredientsPatch):
+        return await db.run_sync(RecipeService.patch_ingredients, db_recipe, changes)
+
+    @staticmethod
+    async def get_recipe(db: AsyncSession, recipe_id: int, user_id: int):
+        return await db.run_sync(RecipeService.get_recipe, recipe_id, user_id)
+
+    @staticmethod
+    async def list_recipes(db: AsyncSession, user_id: int, **filters):
+        return await db.run_sync(lambda session: RecipeService.list_recipes(session, user_id, **filters))
+
+class AsyncLogService:
+    @staticmethod
+    async def create_entry(db: AsyncSession, entry: FoodEntryCreate, user_id: int):
+        return await db.run_sync(LogService.create_entry, entry, user_id)
+
+    @staticmethod
+    async def create_entries(db: AsyncSession, entries: List[FoodEntryCreate], user_id: int):
+        return await db.run_sync(LogService.create_entries, entries, user_id)
+
+    @staticmethod
+    async def list_entries(db: AsyncSession, user_id: int, date=None, start=None, end=None):
+        return await db.run_sync(LogService.list_entries, user_id, date, start, end)
+
+    @staticmethod
+    async def stream_entries(db: AsyncSession, user_id: int, date=None, start=None, end=None, batch_size: int = STREAM_BATCH_SIZE):
+        statement = LogService.entries_select(user_id, date, start, end)
+        result = await db.stream_scalars(statement.execution_options(yield_per=batch_size))
+        async for entry in result:
+            yield entry
+
+    @staticmethod
+    async def get_daily_summary(db: AsyncSession, user_id: int, date):
+        return await db.run_sync(LogService.get_daily_summary, user_id, date)
@@ -0,0 +1,66 @@
+"""Maintenance commands.
+
+Usage: python -m backend.cli rebuild-rollups
+       python -m backend.cli import-ingredients foods.csv [--batch-size 1000] [--no-update] [--restart]
+"""
+import argparse
+import sys
+from .database import SessionLocal, init_db
+from .services import RollupService
+from .ingredient_import import DEFAULT_BATCH_SIZE, ImportFormatError, import_ingredients
+
+def rebuild_rollups(args):
+    db = SessionLocal()
+    try:
+        days = RollupService.rebuild(db)
+    finally:
+        db.close()
+    print(f"Rebuilt daily totals for {days} days")
+
+def _print_progress(stats):
+    sys.stderr.write(f"\r{stats['records']:>10,} records  {stats['rate']:>8,.0f}/s")
+    sys.stderr.flush()
+
+def import_ingredient_file(args):
+    try:
+        stats = import_ingredients(
+            args.path,
+            fmt=args.format,
+            batch_size=args.batch_size,
+            update_existing=not args.no_update,
+            state_path=args.state,
+            restart=args.restart,
+            progress=None if args.quiet else _print_progress,
+        )
+    except (ImportFormatError, OSError) as e:
+        sys.exit(f"error: {e}")
+    if not args.quiet:
+        sys.stderr.write("\n")
+    resumed = f" (resumed after {stats['resumed_at']:,})" if stats["resumed_at"] else ""
+    print(f"Imported {stats['upserted']:,} ingredients from {stats['records']:,} records{resumed} "
+          f"in {stats['elapsed']:.1f}s; skipped {stats['skipped']:,} without a name, "
+          f"refreshed {stats['recipes_refreshed']:,} recipes")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.cli", description="Nutrition Tracker maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-rollups", help="Recompute daily_totals from all food entries")
+    rebuild.set_defaults(func=rebuild_rollups)
+
+    importer = commands.add_parser("import-ingredients", help="Bulk upsert ingredients from a CSV/JSON Lines/JSON dump")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=["csv", "tsv", "jsonl", "json"], help="default: from the file extension")
+    importer.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per transaction")
+    importer.add_argument("--no-update", action="store_true", help="leave existing ingredients unchanged")
+    importer.add_argument("--state", help="resume state file (default: <path>.import-state)")
+    importer.add_argument("--restart", action="store_true", help="ignore saved progress and start over")
+    importer.add_argument("--quiet", action="store_true", help="no progress output")
+    importer.set_defaults(func=import_ingredient_file)
+
+    args = parser.parse_args(argv)
+    init_db()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,237 @@
-from sqlalchemy import create_engine
+import os
+import time
+from sqlalchemy import create_engine, event, inspect, literal, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from .models import Base
+from sqlalchemy.pool import StaticPool
+from dotenv import load_dotenv
+from .models import Base, SchemaMigration
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./nutrition.db"
+load_dotenv()
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./nutrition.db")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Applied to every new SQLite connection; set SQLITE_TUNING=false for driver defaults
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed during a write; NORMAL only fsyncs at checkpoints
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """Engine for the configured URL: tuned SQLite by default, or any other
+    SQLAlchemy URL (e.g. postgresql+psycopg://...) with a sized pool."""
+    if make_url(url).get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+
+    connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if make_url(url).database in (None, "", ":memory:"):
+        # Every connection to :memory: is a new database, so share a single one
+        sqlite_engine = create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        sqlite_engine = create_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    if SQLITE_TUNING:
+        event.listen(sqlite_engine, "connect", _apply_sqlite_pragmas)
+    return sqlite_engine
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        add_missing_columns(connection)
+        create_missing_indexes(connection)
+    run_migrations()
+
+def add_missing_columns(connection):
+    """create_all() never alters existing tables, so add any model columns
+    introduced after a table was first created. Returns the added columns."""
+    inspector = inspect(connection)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if column.default is not None and column.default.is_scalar:
+                # Existing rows take the model default instead of NULL
+                default = literal(column.default.arg).compile(
+                    dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+                )
+                ddl += f" DEFAULT {default}"
+            connection.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+def create_missing_indexes(connection):
+    # Like columns, indexes added to an existing table are skipped by create_all()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def run_migrations():
+    """Apply each data migration once, recording it in schema_migrations."""
+    db = SessionLocal()
+    try:
+        applied = {row[0] for row in db.query(SchemaMigration.name)}
+    finally:
+        db.close()
+
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        migration()
+        db = SessionLocal()
+        try:
+            db.add(SchemaMigration(name=name))
+            db.commit()
+        finally:
+            db.close()
+
+def backfill_recipe_totals():
+    from .models import Recipe
+    from .services import NutritionService
+
+    db = SessionLocal()
+    try:
+        recipe_ids = [row[0] for row in db.query(Recipe.id)]
+        # Versions are first recorded by 0007, from the fully migrated data
+        NutritionService.refresh_totals_for_recipes(db, recipe_ids, snapshot=False)
+        db.commit()
+    finally:
+        db.close()
+
+def normalize_food_entry_dates():
+    # Dates used to be free-form strings; keep only the YYYY-MM-DD part
+    with engine.begin() as connection:
+        # Superseded by the (date, recipe_id) composite index
+        connection.execute(text("DROP INDEX IF EXISTS ix_food_entries_date"))
+        if connection.dialect.name == "sqlite":
+            connection.execute(text(
+                "UPDATE food_entries SET date = substr(trim(date), 1, 10) WHERE length(date) != 10"
+            ))
+        elif connection.dialect.name == "postgresql":
+            connection.execute(text(
+                "ALTER TABLE food_entries ALTER COLUMN date TYPE DATE USING substr(trim(date::text), 1, 10)::date"
+            ))
+
+def rebuild_daily_totals():
+    from .services import RollupService
+
+    db = SessionLocal()
+    try:
+        RollupService.rebuild(db)
+    finally:
+        db.close()
+
+def backfill_ingredient_grams():
+    from .services import NutritionService
+
+    db = SessionLocal()
+    try:
+        # Units that can't be converted keep their old quantity-as-grams reading
+        recipe_ids = NutritionService.refresh_link_grams(db, strict=False)
+        NutritionService.refresh_totals_for_recipes(db, recipe_ids, snapshot=False)
+        db.commit()
+    finally:
+        db.close()
+
+def seed_catalog_version():
+    from .models import CatalogVersion
+
+    db = SessionLocal()
+    try:
+        if db.get(CatalogVersion, 1) is None:
+            db.add(CatalogVersion(id=1, version=1, updated_at=time.time()))
+            db.commit()
+    finally:
+        db.close()
+
+def add_users():
+    from .models import DailyTotal, User, DEFAULT_USER_ID
+    from .services import RollupService
+
+    db = SessionLocal()
+    try:
+        # Owner of every recipe and entry created before users existed
+        if db.get(User, DEFAULT_USER_ID) is None:
+            db.add(User(id=DEFAULT_USER_ID, name="default"))
+            db.commit()
+    finally:
+        db.close()
+
+    with engine.begin() as connection:
+        # Superseded by the (user_id, date) composite index
+        connection.execute(text("DROP INDEX IF EXISTS ix_food_entries_date_recipe_id"))
+        # Rollups used to be keyed by date alone
+        if inspect(connection).get_pk_constraint("daily_totals")["constrained_columns"] != ["user_id", "date"]:
+            DailyTotal.__table__.drop(connection)
+            DailyTotal.__table__.create(connection)
+
+    db = SessionLocal()
+    try:
+        RollupService.rebuild(db)
+    finally:
+        db.close()
+
+def add_recipe_versions():
+    from .models import Recipe
+    from .services import RecipeVersionService, RollupService
+
+    db = SessionLocal()
+    try:
+        # Existing entries are pinned to the recipes as they are now
+        recipe_ids = [row[0] for row in db.query(Recipe.id)]
+        for i in range(0, len(recipe_ids), 1000):
+            RecipeVersionService.snapshot(db, recipe_ids[i:i + 1000])
+        RecipeVersionService.pin_unversioned_entries(db)
+        db.commit()
+        RollupService.rebuild(db)
+    finally:
+        db.close()
+
+MIGRATIONS = [
+    ("0001_recipe_totals", backfill_recipe_totals),
+    ("0002_food_entry_dates", normalize_food_entry_dates),
+    ("0003_daily_totals", rebuild_daily_totals),
+    ("0004_ingredient_grams", backfill_ingredient_grams),
+    ("0005_catalog_version", seed_catalog_version),
+    ("0006_users", add_users),
+    ("0007_recipe_versions", add_recipe_versions),
+]
 
 def get_db():
     db = SessionLocal()
@@ -18,4 +239,3 @@ def get_db():
         yield db
     finally:
         db.close()
-
@@ -0,0 +1,27 @@
+"""NDJSON bodies for GET /log?stream=true, shared by the sync and async handlers.
+
+The request's session is closed once the handler returns, so each generator
+opens its own and keeps it for as long as the response is being written.
+"""
+from .database import SessionLocal
+from .async_database import get_async_session_factory
+from .async_services import AsyncLogService
+from .schemas import FoodEntry
+from .services import LogService, STREAM_BATCH_SIZE
+
+def _line(entry) -> str:
+    return FoodEntry.model_validate(entry).model_dump_json() + "\n"
+
+def stream_entries(user_id, date, start, end):
+    db = SessionLocal()
+    try:
+        statement = LogService.entries_select(user_id, date, start, end).execution_options(yield_per=STREAM_BATCH_SIZE)
+        for entry in db.scalars(statement):
+            yield _line(entry)
+    finally:
+        db.close()
+
+async def async_stream_entries(user_id, date, start, end):
+    async with get_async_session_factory()() as db:
+        async for entry in AsyncLogService.stream_entries(db, user_id, date, start, end, STREAM_BATCH_SIZE):
+            yield _line(entry)
@@ -0,0 +1,47 @@
+"""Conditional GET support for catalog (recipe and ingredient) reads.
+
+Validators come from the CatalogVersion row, which every catalog write bumps
+in its own transaction: the ETag is the version and Last-Modified its
+timestamp. They are read before the data, so a write racing a read can only
+make the validators older than the body, which a later request then
+refreshes.
+"""
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+from .metrics import HTTP_CONDITIONAL_REQUESTS
+
+def catalog_headers(catalog, user_id: Optional[int] = None) -> dict:
+    """Validators for a catalog read; pass user_id when the body is one
+    user's recipes, so each user's copy gets its own ETag."""
+    headers = {
+        "ETag": f'"catalog-{catalog.version}"' if user_id is None else f'"catalog-{catalog.version}-u{user_id}"',
+        "Last-Modified": formatdate(catalog.updated_at or 0, usegmt=True),
+        # Clients may store the body but must revalidate before reusing it
+        "Cache-Control": "no-cache",
+    }
+    if user_id is not None:
+        headers["Vary"] = "X-User-Id"
+    return headers
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def not_modified(request: Request, headers: dict) -> Optional[Response]:
+    """A 304 response when the request's validators still match, else None."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        matched = _etag_matches(if_none_match, headers["ETag"])
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if not if_modified_since:
+            return None
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return None
+        matched = since >= int(parsedate_to_datetime(headers["Last-Modified"]).timestamp())
+    HTTP_CONDITIONAL_REQUESTS.inc(result="not_modified" if matched else "modified")
+    return Response(status_code=304, headers=headers) if matched else None
@@ -0,0 +1,124 @@
+import io
+import os
+import time
+import threading
+from typing import BinaryIO
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # without Pillow uploads are sent to the model unchanged
+    Image = None
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:  # HEIC uploads are rejected without pillow-heif (see requirements.txt)
+    pass
+
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1568"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+HEIF_MIME_TYPES = {"image/heic", "image/heif", "image/heic-sequence", "image/heif-sequence"}
+# ISO base media "ftyp" brands of HEIF images
+HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+
+class UnsupportedImageError(ValueError):
+    pass
+
+class PreprocessStats:
+    """Running totals across all processed uploads in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.original_bytes = 0
+        self.processed_bytes = 0
+        self.seconds = 0.0
+
+    def record(self, original_bytes: int, processed_bytes: int, seconds: float):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original_bytes
+            self.processed_bytes += processed_bytes
+            self.seconds += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "images": self.images,
+                "original_bytes": self.original_bytes,
+                "processed_bytes": self.processed_bytes,
+                "bytes_saved": self.original_bytes - self.processed_bytes,
+                "seconds": round(self.seconds, 3),
+            }
+
+preprocess_stats = PreprocessStats()
+
+def _file_size(fileobj: BinaryIO) -> int:
+    position = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(position)
+    return size
+
+def _is_heif(fileobj: BinaryIO, mime_type: str) -> bool:
+    if (mime_type or "").lower() in HEIF_MIME_TYPES:
+        return True
+    fileobj.seek(0)
+    header = fileobj.read(12)
+    fileobj.seek(0)
+    return header[4:8] == b"ftyp" and header[8:12] in HEIF_BRANDS
+
+def preprocess_image(fileobj: BinaryIO, mime_type: str = "image/jpeg",
+                     max_dimension: int = IMAGE_MAX_DIMENSION,
+                     quality: int = IMAGE_JPEG_QUALITY):
+    """Downsize, strip metadata and re-encode an upload as JPEG.
+
+    Pillow decodes straight from the (spooled) upload file, so the original is
+    never held in memory as one bytes object. EXIF orientation is applied to
+    the pixels before the metadata is dropped. Returns (image_bytes,
+    mime_type, report); if the image can't be decoded the original bytes are
+    returned untouched, except HEIC/HEIF, which vision models don't accept:
+    those raise UnsupportedImageError.
+    """
+    started = time.perf_counter()
+    fileobj.seek(0)
+    original_size = _file_size(fileobj)
+
+    if Image is None:
+        data, out_mime, width, height = fileobj.read(), mime_type, None, None
+    else:
+        try:
+            with Image.open(fileobj) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((max_dimension, max_dimension))
+                if image.mode in ("RGBA", "LA", "P"):
+                    image = image.convert("RGBA")
+                    background = Image.new("RGB", image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel("A"))
+                    image = background
+                elif image.mode != "RGB":
+                    image = image.convert("RGB")
+
+                buffer = io.BytesIO()
+                image.save(buffer, format="JPEG", quality=quality, optimize=True)
+                data, out_mime = buffer.getvalue(), "image/jpeg"
+                width, height = image.size
+        except Exception:
+            fileobj.seek(0)
+            data, out_mime, width, height = fileobj.read(), mime_type, None, None
+
+    if width is None and _is_heif(fileobj, mime_type):
+        raise UnsupportedImageError("HEIC/HEIF images need the pillow-heif package on the server")
+
+    seconds = time.perf_counter() - started
+    preprocess_stats.record(original_size, len(data), seconds)
+    report = {
+        "original_bytes": original_size,
+        "processed_bytes": len(data),
+        "bytes_saved": original_size - len(data),
+        "width": width,
+        "height": height,
+        "duration_ms": round(seconds * 1000, 1),
+    }
+    return data, out_mime, report
@@ -0,0 +1,203 @@
+"""Streaming bulk import of ingredient nutrient dumps (e.g. USDA FoodData Central).
+
+Each record is one food with values per 100 g:
+
+- CSV with a header row: `name` (or `description`) and one column per nutrient,
+  named after the API field (`protein_g_100g`), the nutrient key (`protein_g`)
+  or its FDC nutrient id/number (`1003` / `203`)
+- JSON Lines with the same keys, or FDC food objects (`description` plus
+  `foodNutrients`)
+- A JSON document such as an FDC download, streamed with the optional ijson
+  package
+
+Records are parsed lazily and upserted by name in batches, one transaction
+per batch, so memory stays flat whatever the file size. The number of
+records done is saved to a state file after every batch, and an interrupted
+import resumes from there.
+"""
+import csv
+import json
+import os
+import time
+from itertools import islice
+from typing import Callable, Iterator, Optional
+from .database import SessionLocal
+from .models import Ingredient, RecipeIngredient
+from .nutrients import NUTRIENTS, per_100g_column
+from .services import CatalogService, NutritionService, upsert_insert
+
+try:
+    import ijson
+except ImportError:  # only needed for whole-document JSON files
+    ijson = None
+
+DEFAULT_BATCH_SIZE = 1000
+
+NUTRIENT_COLUMNS = [per_100g_column(n.key) for n in NUTRIENTS]
+
+class ImportFormatError(ValueError):
+    pass
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".csv", ".tsv"):
+        return extension[1:]
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if extension == ".json":
+        return "json"
+    raise ImportFormatError(f"Can't tell the format of {path}; pass --format")
+
+def iter_records(path: str, fmt: Optional[str] = None) -> Iterator[dict]:
+    fmt = fmt or detect_format(path)
+    if fmt in ("csv", "tsv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f, delimiter="\t" if fmt == "tsv" else ",")
+    elif fmt == "jsonl":
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif fmt == "json":
+        if ijson is None:
+            raise ImportFormatError("Streaming a JSON document needs the ijson package; use JSON Lines instead")
+        with open(path, "rb") as f:
+            prefix = _json_items_prefix(f)
+            f.seek(0)
+            yield from ijson.items(f, prefix, use_float=True)
+    else:
+        raise ImportFormatError(f"Unknown format '{fmt}'")
+
+def _json_items_prefix(f) -> str:
+    # A top-level array, or the first array under a top-level key
+    # ({"FoundationFoods": [...]} in FDC downloads)
+    for prefix, event, value in ijson.parse(f):
+        if event == "start_array":
+            return f"{prefix}.item" if prefix else "item"
+    raise ImportFormatError("No array of foods found in the JSON document")
+
+def _number(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_record(record: dict) -> Optional[dict]:
+    """Ingredient column values for one record, or None without a name."""
+    name = (record.get("name") or record.get("description") or "").strip()
+    if not name:
+        return None
+
+    values = {}
+    if "foodNutrients" in record:
+        # FDC food object: amounts keyed by nutrient id and legacy number
+        for item in record.get("foodNutrients") or []:
+            nutrient = item.get("nutrient") or {}
+            amount = _number(item.get("amount"))
+            for key in (nutrient.get("id"), nutrient.get("number")):
+                if key is not None and amount is not None:
+                    values.setdefault(str(key), amount)
+    else:
+        values = record
+
+    row = {"name": name}
+    for nutrient, column in zip(NUTRIENTS, NUTRIENT_COLUMNS):
+        for key in (column, nutrient.key, *nutrient.fdc_ids):
+            amount = _number(values.get(key))
+            if amount is not None:
+                row[column] = amount
+                break
+        else:
+            row[column] = 0.0
+    return row
+
+def upsert_batch(db, rows, update_existing: bool = True) -> int:
+    """Insert rows by name, updating the nutrients of existing names unless
+    update_existing is False. Returns the number of recipes refreshed."""
+    # A name may appear once per statement; the last record wins
+    rows = list({row["name"]: row for row in rows}.values())
+    # Executemany of one cached statement; compiling a multi-row VALUES
+    # clause per batch costs more than the inserts themselves
+    stmt = upsert_insert(db, Ingredient.__table__)
+    if update_existing:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={column: stmt.excluded[column] for column in NUTRIENT_COLUMNS},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=["name"])
+    db.execute(stmt, rows)
+    CatalogService.bump(db)
+
+    if not update_existing:
+        return 0
+    # Recipes using an updated ingredient need fresh cached totals
+    recipe_ids = [
+        row[0] for row in db.query(RecipeIngredient.recipe_id)
+        .join(Ingredient, RecipeIngredient.ingredient_id == Ingredient.id)
+        .filter(Ingredient.name.in_([row["name"] for row in rows]))
+        .distinct()
+    ]
+    NutritionService.refresh_totals_for_recipes(db, recipe_ids)
+    return len(recipe_ids)
+
+def _load_state(state_path: str, source_stat) -> int:
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    # A changed source file starts over
+    if state.get("size") != source_stat.st_size or state.get("mtime") != source_stat.st_mtime:
+        return 0
+    return int(state.get("records", 0))
+
+def _save_state(state_path: str, source_stat, records: int):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"size": source_stat.st_size, "mtime": source_stat.st_mtime, "records": records}, f)
+    os.replace(tmp_path, state_path)
+
+def import_ingredients(path: str, fmt: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                       update_existing: bool = True, state_path: Optional[str] = None,
+                       restart: bool = False, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Import a nutrient dump in batches, resuming from state_path
+    (default: <path>.import-state) unless restart is set. Returns the stats."""
+    state_path = state_path or f"{path}.import-state"
+    source_stat = os.stat(path)
+    skip = 0 if restart else _load_state(state_path, source_stat)
+
+    records = iter_records(path, fmt)
+    # Already-imported records are still parsed, but not written again
+    for _ in islice(records, skip):
+        pass
+
+    stats = {"records": skip, "resumed_at": skip, "upserted": 0, "skipped": 0, "recipes_refreshed": 0}
+    started = time.perf_counter()
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        rows = [row for row in map(parse_record, chunk) if row is not None]
+        db = SessionLocal()
+        try:
+            if rows:
+                stats["recipes_refreshed"] += upsert_batch(db, rows, update_existing)
+            db.commit()
+        finally:
+            db.close()
+
+        stats["records"] += len(chunk)
+        stats["upserted"] += len(rows)
+        stats["skipped"] += len(chunk) - len(rows)
+        _save_state(state_path, source_stat, stats["records"])
+        if progress:
+            elapsed = time.perf_counter() - started
+            progress(dict(stats, elapsed=elapsed, rate=(stats["records"] - skip) / elapsed if elapsed else 0.0))
+
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
@@ -0,0 +1,189 @@
+"""In-memory trigram index over ingredient names for fuzzy and prefix search.
+
+Names are normalized (lower case, punctuation to spaces) and split into
+trigrams, with a posting list of name slots per trigram. A query concatenates
+the posting arrays of its trigrams and bincounts them to get the shared
+trigram count of every name at once. Candidates are ranked by Jaccard
+similarity with a bonus for prefix matches.
+
+The index loads lazily and then catches up before each lookup, reading
+through the caller's session (so in-memory SQLite, with its single shared
+connection, and async sessions driven by run_sync work unchanged). It fetches
+rows with a higher id than it has seen, plus recent ids below that which were
+missing: on PostgreSQL a transaction can commit a lower id after a higher one
+is visible. Such gaps are rechecked for GAP_TTL_SECONDS. Inserts from other
+workers are therefore picked up too, while renames are applied by the process
+that made them.
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+import numpy as np
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from .models import Ingredient
+
+# Candidates (by similarity) considered for the prefix bonus per result requested
+CANDIDATES_PER_RESULT = 20
+PREFIX_BONUS = 0.5
+
+# Missing ids below the highest seen are rechecked this long (longer than any
+# insert transaction), and at most this many of them are tracked
+GAP_TTL_SECONDS = 600
+MAX_GAPS = 1000
+REFRESH_BATCH = 5000
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+def normalize_name(name: str) -> str:
+    return _NON_ALNUM.sub(" ", (name or "").lower()).strip()
+
+def trigrams(normalized: str) -> set:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Each indexed ingredient occupies a dense slot
+        self._slots = {}
+        self._ids = []
+        self._names = []
+        self._normalized = []
+        self._trigram_counts = np.zeros(1024, dtype=np.int32)
+        self._postings = defaultdict(list)
+        # NumPy copies of posting lists, dropped when the list changes
+        self._posting_arrays = {}
+        self._by_normalized = {}
+        self._max_id = 0
+        # Missing id -> when it was first missed
+        self._gaps = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def refresh(self, db: Session):
+        """Index ingredients committed since the last refresh.
+
+        Runs in db's transaction, so call it before that transaction inserts
+        ingredients; they are indexed once committed.
+        """
+        with self._lock:
+            previous_max = self._max_id
+            gaps = list(self._gaps)
+        condition = Ingredient.id > previous_max
+        if gaps:
+            condition = or_(condition, Ingredient.id.in_(gaps))
+        result = db.execute(
+            select(Ingredient.id, Ingredient.name).where(condition).order_by(Ingredient.id)
+            .execution_options(yield_per=REFRESH_BATCH)
+        )
+        seen = set()
+        # Rows are fetched outside the lock: under run_sync a fetch yields to
+        # the event loop, where another lookup may be waiting for it
+        for partition in result.partitions():
+            with self._lock:
+                for ingredient_id, name in partition:
+                    self._add(ingredient_id, name)
+                    seen.add(ingredient_id)
+
+        now = time.monotonic()
+        with self._lock:
+            for ingredient_id in seen:
+                self._gaps.pop(ingredient_id, None)
+            new_max = max(seen, default=previous_max)
+            for ingredient_id in range(max(previous_max, new_max - MAX_GAPS) + 1, new_max):
+                if ingredient_id not in seen:
+                    self._gaps.setdefault(ingredient_id, now)
+            expired = [i for i, missed_at in self._gaps.items() if now - missed_at > GAP_TTL_SECONDS]
+            expired.extend(sorted(self._gaps)[:max(0, len(self._gaps) - MAX_GAPS)])
+            for ingredient_id in expired:
+                self._gaps.pop(ingredient_id, None)
+
+    def rename(self, ingredient_id: int, name: str):
+        """Re-index a committed ingredient under its new name."""
+        with self._lock:
+            if ingredient_id in self._slots:
+                self._add(ingredient_id, name)
+
+    def _add(self, ingredient_id: int, name: str):
+        slot = self._slots.get(ingredient_id)
+        if slot is None:
+            slot = len(self._ids)
+            self._slots[ingredient_id] = slot
+            self._ids.append(ingredient_id)
+            self._names.append(None)
+            self._normalized.append(None)
+            if slot >= len(self._trigram_counts):
+                self._trigram_counts = np.resize(self._trigram_counts, 2 * len(self._trigram_counts))
+        else:
+            previous = self._normalized[slot]
+            for trigram in trigrams(previous):
+                self._postings[trigram].remove(slot)
+                self._posting_arrays.pop(trigram, None)
+            if self._by_normalized.get(previous) == ingredient_id:
+                del self._by_normalized[previous]
+
+        normalized = normalize_name(name)
+        grams = trigrams(normalized)
+        for trigram in grams:
+            self._postings[trigram].append(slot)
+            self._posting_arrays.pop(trigram, None)
+        self._names[slot] = name
+        self._normalized[slot] = normalized
+        self._trigram_counts[slot] = len(grams)
+        self._by_normalized.setdefault(normalized, ingredient_id)
+        self._max_id = max(self._max_id, ingredient_id)
+
+    def _posting_array(self, trigram: str) -> np.ndarray:
+        array = self._posting_arrays.get(trigram)
+        if array is None:
+            array = np.array(self._postings[trigram], dtype=np.intp)
+            self._posting_arrays[trigram] = array
+        return array
+
+    def find_normalized(self, name: str) -> Optional[int]:
+        """Id of an ingredient whose name differs from `name` only in case,
+        punctuation or spacing, e.g. "Chicken Breast" and "chicken-breast".
+        Call refresh() first to see recent inserts."""
+        return self._by_normalized.get(normalize_name(name))
+
+    def search(self, db: Session, query: str, limit: int = 10):
+        """Best matches for `query` as [(ingredient_id, name, score)], best first.
+
+        Scores are trigram Jaccard similarity (0-1) plus PREFIX_BONUS when the
+        name starts with the query.
+        """
+        self.refresh(db)
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+        query_grams = trigrams(normalized)
+
+        with self._lock:
+            arrays = [self._posting_array(t) for t in query_grams if self._postings.get(t)]
+            if not arrays:
+                return []
+            shared = np.bincount(np.concatenate(arrays), minlength=len(self._ids))
+            candidates = np.flatnonzero(shared)
+            counts = shared[candidates]
+            scores = counts / (len(query_grams) + self._trigram_counts[candidates] - counts)
+
+            keep = min(len(candidates), limit * CANDIDATES_PER_RESULT)
+            best = np.argpartition(-scores, keep - 1)[:keep]
+            results = []
+            for slot, score in zip(candidates[best].tolist(), scores[best].tolist()):
+                name_normalized = self._normalized[slot]
+                if name_normalized.startswith(normalized):
+                    score += PREFIX_BONUS
+                results.append((score, -len(name_normalized), slot))
+
+            results.sort(reverse=True)
+            return [
+                (self._ids[slot], self._names[slot], round(score, 3))
+                for score, _, slot in results[:limit]
+            ]
+
+ingredient_index = IngredientIndex()
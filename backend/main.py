@@ -1,126 +1,327 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from .database import engine, get_db, init_db
-from .models import Base, RecipeType, RecipeIngredient, Ingredient as DBIngredient, FoodEntry as DBFoodEntry
-from .schemas import RecipeCreate, Recipe, IngredientCreate, Ingredient, FoodEntryCreate, FoodEntry
-from .services import RecipeService, IngredientService, NutritionService
+from .models import Base, RecipeType
+from .schemas import RecipeCreate, Recipe, RecipeIngredientsPatch, RecipeVersion, RecipeVersionSummary, IngredientCreate, Ingredient, IngredientMatch, FoodEntryCreate, FoodEntry, FoodEntryBatchResult, DailySummary, TrendPoint, AnalysisJob, AnalysisQueueStats, AnalysisCacheStats, SlowRequestSettings, SlowRequestSummary, UserCreate, User, parse_recipe_fields, dump_recipes
+from .services import RecipeService, IngredientService, NutritionService, LogService, RollupService, CatalogService, UserService, RecipeVersionService, IngredientNotInRecipeError, IngredientNameTakenError
 from .ai_service import AIService
+from .ai_jobs import analysis_jobs, QueueFullError
+from .ai_cache import analysis_cache
+from .image_processing import UnsupportedImageError, preprocess_image
+from .async_database import DB_ASYNC
+from .units import UnitConversionError
+from .http_cache import catalog_headers, not_modified
+from .entry_stream import stream_entries
+from .users import get_user_id
+from .profiling import SlowRequestMiddleware, slow_requests
+from .metrics import METRICS_ENABLED, CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, instrument_sqlalchemy, registry as metrics_registry
 import json
+import datetime
 
 app = FastAPI(title="Nutrition Tracker API")
+# Recipe listings are large, repetitive JSON; small bodies aren't worth it
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+# Outside compression, so slow-request profiles include it; a flag check per
+# request until profiling is switched on
+app.add_middleware(SlowRequestMiddleware)
+if METRICS_ENABLED:
+    # Outermost, so request timings include compression and profiling
+    app.add_middleware(MetricsMiddleware)
+    instrument_sqlalchemy()
+
+if DB_ASYNC:
+    # Registered first so these paths resolve to the async handlers
+    from .async_routes import router as async_router
+    app.include_router(async_router)
+
+@app.exception_handler(UnitConversionError)
+def unit_conversion_error(request, exc: UnitConversionError):
+    # Raised while resolving recipe ingredient quantities to grams
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(IngredientNotInRecipeError)
+def ingredient_not_in_recipe(request, exc: IngredientNotInRecipeError):
+    # Raised for PATCH /recipes/{id}/ingredients removals that match nothing
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(IngredientNameTakenError)
+def ingredient_name_taken(request, exc: IngredientNameTakenError):
+    # Raised when an ingredient is renamed to an existing ingredient's name
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
 
 @app.on_event("startup")
 def on_startup():
     init_db()
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/slow-requests", response_model=List[SlowRequestSummary])
+def list_slow_requests():
+    """Stored slow-request reports, newest first."""
+    return slow_requests.list_reports()
+
+@app.get("/debug/slow-requests/settings", response_model=SlowRequestSettings)
+def get_slow_request_settings():
+    return slow_requests.settings()
+
+@app.put("/debug/slow-requests/settings", response_model=SlowRequestSettings)
+def update_slow_request_settings(settings: SlowRequestSettings):
+    """Switch profiling on or off and change the threshold at runtime."""
+    slow_requests.configure(enabled=settings.enabled, threshold_ms=settings.threshold_ms)
+    return slow_requests.settings()
+
+@app.get("/debug/slow-requests/{report_id}")
+def get_slow_request(report_id: str):
+    """A full report: the SQL statements issued and the sampled stacks."""
+    report = slow_requests.load_report(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return report
+
 @app.post("/analyze-image")
-def analyze_image(file: UploadFile = File(...)):
-    contents = file.file.read()
-    result = AIService.analyze_image(contents, file.content_type)
+def analyze_image(
+    response: Response,
+    file: UploadFile = File(...),
+    mode: str = Query("sync", pattern="^(sync|job)$"),
+    no_cache: bool = False
+):
+    """mode=sync waits for the analysis; mode=job queues it and returns an
+    AnalysisJob to poll via GET /analyze-image/{job_id}. no_cache=true skips
+    the cached-result lookup and always calls the vision model."""
+    # Downsized, EXIF-stripped JPEG decoded straight from the spooled upload
+    try:
+        contents, mime_type, preprocessing = preprocess_image(file.file, file.content_type)
+    except UnsupportedImageError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    if mode == "job":
+        try:
+            job = analysis_jobs.submit(contents, mime_type, use_cache=not no_cache, preprocessing=preprocessing)
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        response.status_code = 202
+        return job
+    response.headers["X-Image-Bytes-Saved"] = str(preprocessing["bytes_saved"])
+    response.headers["X-Image-Preprocess-Ms"] = str(preprocessing["duration_ms"])
+    result = AIService.analyze_image(contents, mime_type, use_cache=not no_cache)
     return result
 
+@app.get("/analyze-image/queue", response_model=AnalysisQueueStats)
+def get_analysis_queue_stats():
+    return analysis_jobs.stats()
+
+@app.get("/analyze-image/cache", response_model=AnalysisCacheStats)
+def get_analysis_cache_stats():
+    return analysis_cache.stats()
+
+@app.get("/analyze-image/{job_id}", response_model=AnalysisJob)
+def get_analysis_job(job_id: str):
+    job = analysis_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return job
+
+@app.post("/users", response_model=User)
+def create_user(user: UserCreate, db: Session = Depends(get_db)):
+    db_user = UserService.create_user(db, user)
+    if not db_user:
+        raise HTTPException(status_code=409, detail="User name already taken")
+    return db_user
+
+@app.get("/users/me", response_model=User)
+def get_current_user(user_id: int = Depends(get_user_id), db: Session = Depends(get_db)):
+    return UserService.get_user(db, user_id)
+
 @app.post("/ingredients", response_model=Ingredient)
 def create_ingredient(ingredient: IngredientCreate, db: Session = Depends(get_db)):
     return IngredientService.create_ingredient(db, ingredient)
 
+@app.get("/ingredients/search", response_model=List[IngredientMatch])
+def search_ingredients(q: str, limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+    """Fuzzy and prefix matches for q, best first (e.g. to map AI-detected
+    names onto existing ingredients)."""
+    return IngredientService.search_ingredients(db, q, limit)
+
+@app.put("/ingredients/{ingredient_id}", response_model=Ingredient)
+def update_ingredient(ingredient_id: int, ingredient: IngredientCreate, db: Session = Depends(get_db)):
+    db_ingredient = IngredientService.update_ingredient(db, ingredient_id, ingredient)
+    if not db_ingredient:
+        raise HTTPException(status_code=404, detail="Ingredient not found")
+    return db_ingredient
+
 @app.get("/ingredients", response_model=List[Ingredient])
-def list_ingredients(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def list_ingredients(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    headers = catalog_headers(CatalogService.current(db))
+    if cached := not_modified(request, headers):
+        return cached
+    response.headers.update(headers)
     return IngredientService.list_ingredients(db, skip, limit)
 
 @app.post("/recipes", response_model=Recipe)
-def create_recipe(recipe: RecipeCreate, db: Session = Depends(get_db)):
-    return RecipeService.create_recipe(db, recipe)
+def create_recipe(recipe: RecipeCreate, user_id: int = Depends(get_user_id), db: Session = Depends(get_db)):
+    return RecipeService.create_recipe(db, recipe, user_id)
+
+@app.get("/recipes")
+def list_recipes(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    name_prefix: Optional[str] = None,
+    type: Optional[RecipeType] = None,
+    summary: bool = False,
+    fields: Optional[str] = None,
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    """List the user's recipes as full Recipe objects, or as RecipeSummary
+    objects with summary=true. fields=id,name,... returns only the requested
+    fields. When limit is set and more rows exist, X-Next-Cursor holds the
+    cursor to pass for the next page. Responses carry catalog ETag/Last-Modified
+    validators and conditional requests get 304 while the catalog is unchanged."""
+    try:
+        include = parse_recipe_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = catalog_headers(CatalogService.current(db), user_id)
+    if cached := not_modified(request, headers):
+        return cached
+    response.headers.update(headers)
 
-@app.get("/recipes", response_model=List[Recipe])
-def list_recipes(db: Session = Depends(get_db)):
-    return RecipeService.list_recipes(db)
+    with_ingredients = not summary and (include is None or "ingredients" in include)
+    recipes, next_cursor = RecipeService.list_recipes(
+        db, user_id, cursor=cursor, limit=limit, name_prefix=name_prefix,
+        recipe_type=type, with_ingredients=with_ingredients
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return dump_recipes(recipes, summary, include)
 
 @app.get("/recipes/{recipe_id}", response_model=Recipe)
-def get_recipe(recipe_id: int, db: Session = Depends(get_db)):
-    recipe = RecipeService.get_recipe(db, recipe_id)
+def get_recipe(recipe_id: int, request: Request, response: Response,
+               user_id: int = Depends(get_user_id), db: Session = Depends(get_db)):
+    headers = catalog_headers(CatalogService.current(db), user_id)
+    # Checked before the ETag, so a missing or another user's recipe is a 404
+    recipe = RecipeService.get_recipe(db, recipe_id, user_id)
     if not recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
+    if cached := not_modified(request, headers):
+        return cached
+    response.headers.update(headers)
     return recipe
 
 @app.put("/recipes/{recipe_id}", response_model=Recipe)
-def update_recipe(recipe_id: int, recipe: RecipeCreate, db: Session = Depends(get_db)):
-    db_recipe = RecipeService.get_recipe(db, recipe_id)
+def update_recipe(recipe_id: int, recipe: RecipeCreate, user_id: int = Depends(get_user_id),
+                  db: Session = Depends(get_db)):
+    db_recipe = RecipeService.get_recipe(db, recipe_id, user_id)
     if not db_recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
     
-    # Update fields
-    db_recipe.name = recipe.name
-    db_recipe.standard_serving_amount = recipe.standard_serving_amount
-    db_recipe.standard_serving_unit = recipe.standard_serving_unit
-    db_recipe.type = recipe.type
-    db_recipe.nutrition_direct = recipe.nutrition_direct
-    
-    # Update ingredients if provided (full replace strategy for simplicity)
-    if recipe.type == RecipeType.GRANULAR and recipe.ingredients is not None:
-        # Clear existing
-        db.query(RecipeIngredient).filter(RecipeIngredient.recipe_id == db_recipe.id).delete()
-        
-        # Add new
-        for item in recipe.ingredients:
-             # Ensure ingredient exists
-            ingredient = db.query(DBIngredient).filter(DBIngredient.name == item.ingredient_name).first()
-            if not ingredient:
-                 # Create ingredient if missing
-                nutrition = item.nutrition_per_100g or {}
-                ing_create = IngredientCreate(
-                    name=item.ingredient_name,
-                    energy_kcal_100g=nutrition.get('energy_kcal', 0),
-                    protein_g_100g=nutrition.get('protein_g', 0),
-                    carbs_g_100g=nutrition.get('carbs_g', 0),
-                    fat_g_100g=nutrition.get('fat_g', 0)
-                )
-                ingredient = IngredientService.create_ingredient(db, ing_create)
-
-            db_item = RecipeIngredient(
-                recipe_id=db_recipe.id,
-                ingredient_id=ingredient.id,
-                quantity=item.quantity,
-                unit=item.unit
-            )
-            db.add(db_item)
-            
-    db.commit()
-    db.refresh(db_recipe)
-    return db_recipe
+    return RecipeService.update_recipe(db, db_recipe, recipe)
+
+@app.patch("/recipes/{recipe_id}/ingredients", response_model=Recipe)
+def patch_recipe_ingredients(recipe_id: int, changes: RecipeIngredientsPatch, user_id: int = Depends(get_user_id),
+                             db: Session = Depends(get_db)):
+    """Add, change or remove individual ingredients of a granular recipe
+    without resending the rest."""
+    db_recipe = RecipeService.get_recipe(db, recipe_id, user_id)
+    if not db_recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    if db_recipe.type != RecipeType.GRANULAR:
+        raise HTTPException(status_code=400, detail="Only granular recipes have ingredients")
+    return RecipeService.patch_ingredients(db, db_recipe, changes)
 
 @app.post("/recipes/{recipe_id}/flatten", response_model=Recipe)
-def flatten_recipe(recipe_id: int, db: Session = Depends(get_db)):
-    recipe = RecipeService.flatten_recipe(db, recipe_id)
+def flatten_recipe(recipe_id: int, user_id: int = Depends(get_user_id), db: Session = Depends(get_db)):
+    recipe = RecipeService.flatten_recipe(db, recipe_id, user_id)
     if not recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
     return recipe
 
+@app.get("/recipes/{recipe_id}/versions", response_model=List[RecipeVersionSummary])
+def list_recipe_versions(recipe_id: int, user_id: int = Depends(get_user_id), db: Session = Depends(get_db)):
+    """The recipe's versions, newest first."""
+    recipe = RecipeService.get_recipe(db, recipe_id, user_id)
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return RecipeVersionService.list_versions(db, recipe_id)
+
+@app.get("/recipes/{recipe_id}/versions/{version}", response_model=RecipeVersion)
+def get_recipe_version(recipe_id: int, version: int, user_id: int = Depends(get_user_id),
+                       db: Session = Depends(get_db)):
+    if not RecipeService.get_recipe(db, recipe_id, user_id):
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    db_version = RecipeVersionService.get_version(db, recipe_id, version)
+    if not db_version:
+        raise HTTPException(status_code=404, detail="Recipe version not found")
+    return db_version
+
+@app.post("/recipes/{recipe_id}/versions/{version}/restore", response_model=Recipe)
+def restore_recipe_version(recipe_id: int, version: int, user_id: int = Depends(get_user_id),
+                           db: Session = Depends(get_db)):
+    """Make a past version current again; entries logged since keep theirs."""
+    recipe = RecipeService.get_recipe(db, recipe_id, user_id)
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    db_version = RecipeVersionService.get_version(db, recipe_id, version)
+    if not db_version:
+        raise HTTPException(status_code=404, detail="Recipe version not found")
+    return RecipeService.restore_version(db, recipe, db_version)
+
 @app.post("/log", response_model=FoodEntry)
-def log_food(entry: FoodEntryCreate, db: Session = Depends(get_db)):
-    db_entry = DBFoodEntry(**entry.dict())
-    db.add(db_entry)
-    db.commit()
-    db.refresh(db_entry)
+def log_food(entry: FoodEntryCreate, user_id: int = Depends(get_user_id), db: Session = Depends(get_db)):
+    db_entry = LogService.create_entry(db, entry, user_id)
+    if not db_entry:
+        raise HTTPException(status_code=404, detail="Recipe not found")
     return db_entry
 
+@app.post("/log/batch", response_model=FoodEntryBatchResult)
+def log_food_batch(entries: List[FoodEntryCreate], user_id: int = Depends(get_user_id),
+                   db: Session = Depends(get_db)):
+    return LogService.create_entries(db, entries, user_id)
+
 @app.get("/log", response_model=List[FoodEntry])
-def get_log(date: str = None, db: Session = Depends(get_db)):
-    query = db.query(DBFoodEntry)
-    if date:
-        query = query.filter(DBFoodEntry.date == date)
-    return query.all()
+def get_log(
+    date: Optional[datetime.date] = None,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    stream: bool = False,
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    """The user's entries for a single date or an inclusive start/end range.
+    stream=true returns newline-delimited JSON produced in batches, for long
+    ranges."""
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if stream:
+        return StreamingResponse(stream_entries(user_id, date, start, end), media_type="application/x-ndjson")
+    return LogService.list_entries(db, user_id, date, start, end)
+
+@app.get("/log/summary", response_model=DailySummary)
+def get_log_summary(date: datetime.date, user_id: int = Depends(get_user_id), db: Session = Depends(get_db)):
+    return LogService.get_daily_summary(db, user_id, date)
+
+@app.get("/stats/trends", response_model=List[TrendPoint])
+def get_trends(
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    return RollupService.get_trends(db, user_id, granularity, start, end)
 
 @app.delete("/recipes/{recipe_id}")
-def delete_recipe(recipe_id: int, db: Session = Depends(get_db)):
-    recipe = RecipeService.get_recipe(db, recipe_id)
+def delete_recipe(recipe_id: int, user_id: int = Depends(get_user_id), db: Session = Depends(get_db)):
+    recipe = RecipeService.get_recipe(db, recipe_id, user_id)
     if not recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
     
-    # Manually delete associated food entries first (simulating cascade)
-    db.query(DBFoodEntry).filter(DBFoodEntry.recipe_id == recipe_id).delete()
-    
-    # Delete the recipe
-    db.delete(recipe)
-    db.commit()
+    RecipeService.delete_recipe(db, recipe)
     return {"message": "Recipe deleted successfully"}
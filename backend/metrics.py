@@ -0,0 +1,302 @@
+"""In-process metrics, served in the Prometheus text format on GET /metrics.
+
+MetricsMiddleware times every request by route template and attributes the
+SQL it runs to it (query count and database time, from SQLAlchemy cursor
+events), so a slow endpoint can be split into database time and the rest
+(serialization, Python work). Responses also carry a Server-Timing header
+with the same split. The AI service records analysis durations and token
+usage, and cache and upload preprocessing counters are read at scrape time.
+
+Values live in this process only, like the analysis job queue, which fits the
+single uvicorn worker run.sh starts.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+AI_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+_INF_BUCKET = 'le="+Inf"'
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self._sample_lines()
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _sample_lines(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _sample_lines(self):
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF_BUCKET)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+class CallbackMetric(_Metric):
+    """A gauge or counter whose values are read from callback() at scrape
+    time, as {label values tuple: value}."""
+
+    def __init__(self, name: str, help: str, callback: Callable[[], dict], labelnames=(), type: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def _sample_lines(self):
+        for key, value in self.callback().items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, callback, labelnames=(), type: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, callback, labelnames, type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A failing callback shouldn't take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template",
+    ("method", "route", "status"),
+)
+REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per request",
+    ("method", "route"), COUNT_BUCKETS,
+)
+REQUEST_DB_DURATION = registry.histogram(
+    "http_request_db_duration_seconds", "Time spent executing SQL per request",
+    ("method", "route"),
+)
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Duration of single SQL statements, by operation",
+    ("operation",), QUERY_BUCKETS,
+)
+DB_ERRORS = registry.counter(
+    "db_errors_total", "Failed SQL statements; kind is 'locked' for SQLite lock timeouts",
+    ("kind",),
+)
+AI_ANALYSIS_DURATION = registry.histogram(
+    "ai_analysis_duration_seconds", "Vision provider calls (cache hits excluded)",
+    ("provider", "outcome"), AI_BUCKETS,
+)
+AI_TOKENS = registry.counter(
+    "ai_tokens_total", "Tokens reported by the vision provider",
+    ("model", "kind"),
+)
+HTTP_CONDITIONAL_REQUESTS = registry.counter(
+    "http_conditional_requests_total", "Conditional catalog reads, by whether they got a 304",
+    ("result",),
+)
+
+def _ai_cache_lookups():
+    from .ai_cache import analysis_cache
+    return {
+        ("hit",): analysis_cache.hits,
+        ("near_hit",): analysis_cache.near_hits,
+        ("miss",): analysis_cache.misses,
+        ("bypass",): analysis_cache.bypassed,
+    }
+
+def _ai_cache_hit_ratio():
+    from .ai_cache import analysis_cache
+    lookups = analysis_cache.hits + analysis_cache.near_hits + analysis_cache.misses
+    return {(): (analysis_cache.hits + analysis_cache.near_hits) / lookups if lookups else 0.0}
+
+def _ai_queue():
+    from .ai_jobs import analysis_jobs
+    stats = analysis_jobs.stats()
+    return {("queued",): stats["queue_depth"], ("running",): stats["running"]}
+
+def _preprocessed_images():
+    from .image_processing import preprocess_stats
+    return {(): preprocess_stats.snapshot()["images"]}
+
+def _preprocessed_bytes():
+    from .image_processing import preprocess_stats
+    stats = preprocess_stats.snapshot()
+    return {("original",): stats["original_bytes"], ("processed",): stats["processed_bytes"]}
+
+def _preprocess_seconds():
+    from .image_processing import preprocess_stats
+    return {(): preprocess_stats.snapshot()["seconds"]}
+
+registry.callback("ai_analysis_cache_lookups_total", "Analysis cache lookups by result",
+                  _ai_cache_lookups, ("result",), type="counter")
+registry.callback("ai_analysis_cache_hit_ratio", "Share of analysis cache lookups served from the cache",
+                  _ai_cache_hit_ratio)
+registry.callback("ai_analysis_jobs", "Analysis jobs by state", _ai_queue, ("state",))
+registry.callback("image_preprocess_images_total", "Uploads re-encoded before analysis",
+                  _preprocessed_images, type="counter")
+registry.callback("image_preprocess_bytes_total", "Upload sizes before and after re-encoding",
+                  _preprocessed_bytes, ("stage",), type="counter")
+registry.callback("image_preprocess_seconds_total", "Time spent re-encoding uploads",
+                  _preprocess_seconds, type="counter")
+
+# [query count, seconds in SQL] of the request being served; the context is
+# copied into threadpool workers and run_sync greenlets, so queries issued
+# there are attributed to it
+_request_db = ContextVar("request_db", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_query_started"].pop()
+    DB_QUERY_DURATION.observe(elapsed, operation=statement.lstrip()[:6].upper())
+    request_db = _request_db.get()
+    if request_db is not None:
+        request_db[0] += 1
+        request_db[1] += elapsed
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("metrics_query_started"):
+        connection.info["metrics_query_started"].pop()
+    error = exception_context.original_exception
+    DB_ERRORS.inc(kind="locked" if "locked" in str(error) else type(error).__name__)
+
+_instrumented = False
+
+def instrument_sqlalchemy():
+    """Time every statement on every engine (the async engine included)."""
+    global _instrumented
+    if _instrumented:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _instrumented = True
+
+class MetricsMiddleware:
+    """ASGI middleware recording REQUEST_* metrics, measured until the last
+    body chunk is sent so streamed responses count in full."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        request_db = [0, 0.0]
+        token = _request_db.set(request_db)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                timing = (f'db;dur={request_db[1] * 1000:.1f};desc="{request_db[0]} queries", '
+                          f"app;dur={elapsed_ms:.1f}")
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_db.reset(token)
+            # The matched route's template, not the raw path, keeps label values bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_DURATION.observe(time.perf_counter() - started, method=method, route=route, status=status)
+            REQUEST_DB_QUERIES.observe(request_db[0], method=method, route=route)
+            REQUEST_DB_DURATION.observe(request_db[1], method=method, route=route)
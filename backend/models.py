@@ -1,27 +1,40 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Enum, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, Enum, ForeignKey, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship
+from .nutrients import NUTRIENTS, per_100g_column, total_column
 import enum
 
 Base = declarative_base()
 
+# Owner of rows created before users existed, and of requests naming no user
+DEFAULT_USER_ID = 1
+
 class RecipeType(str, enum.Enum):
     GRANULAR = "GRANULAR"
     DIRECT = "DIRECT"
 
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True)
+
 class Ingredient(Base):
+    """Shared catalog entry; unlike recipes and food entries it has no owner."""
     __tablename__ = "ingredients"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
-    energy_kcal_100g = Column(Float, default=0.0)
-    protein_g_100g = Column(Float, default=0.0)
-    carbs_g_100g = Column(Float, default=0.0)
-    fat_g_100g = Column(Float, default=0.0)
+    # One <nutrient>_100g column per entry in NUTRIENTS, added below
+
+    # For converting volume and count units to grams (see units.py)
+    density_g_per_ml = Column(Float, nullable=True)
+    piece_weight_g = Column(Float, nullable=True)
 
 class Recipe(Base):
     __tablename__ = "recipes"
 
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), default=DEFAULT_USER_ID)
     name = Column(String, index=True)
     type = Column(Enum(RecipeType), default=RecipeType.GRANULAR)
     standard_serving_amount = Column(Float, default=1.0)
@@ -30,9 +43,29 @@ class Recipe(Base):
     # For DIRECT recipes, we store nutrition directly
     nutrition_direct = Column(JSON, nullable=True)
 
+    # Cached nutrition per standard serving (total_<nutrient> columns, added
+    # below), kept in sync by NutritionService.refresh_recipe_totals
+    total_grams = Column(Float, default=0.0)
+
+    # Latest RecipeVersion; new food entries are pinned to it
+    current_version_id = Column(Integer, nullable=True)
+
     ingredients = relationship("RecipeIngredient", back_populates="recipe", cascade="all, delete-orphan")
     food_entries = relationship("FoodEntry", back_populates="recipe")
 
+    __table_args__ = (
+        # A user's recipes by id (keyset pages) and by name prefix
+        Index("ix_recipes_user_id_id", "user_id", "id"),
+        Index("ix_recipes_user_id_name", "user_id", "name"),
+    )
+
+    @property
+    def nutrition(self):
+        return {
+            n.key: round(getattr(self, total_column(n.key)) or 0, n.decimals)
+            for n in NUTRIENTS
+        }
+
 class RecipeIngredient(Base):
     __tablename__ = "recipe_ingredients"
 
@@ -41,20 +74,127 @@ class RecipeIngredient(Base):
     ingredient_id = Column(Integer, ForeignKey("ingredients.id"))
     quantity = Column(Float)
     unit = Column(String)
+    # quantity in unit, converted to grams when the row is written
+    grams = Column(Float, nullable=True)
 
     recipe = relationship("Recipe", back_populates="ingredients")
     ingredient = relationship("Ingredient")
 
+class IngredientSet(Base):
+    """Immutable ingredient list, shared by every recipe version with the
+    same content. Addressed by a digest of its items."""
+    __tablename__ = "ingredient_sets"
+
+    id = Column(Integer, primary_key=True)
+    digest = Column(String, unique=True)
+
+    items = relationship("IngredientSetItem", order_by="IngredientSetItem.position", lazy="selectin")
+
+class IngredientSetItem(Base):
+    __tablename__ = "ingredient_set_items"
+
+    id = Column(Integer, primary_key=True)
+    set_id = Column(Integer, ForeignKey("ingredient_sets.id"), index=True)
+    position = Column(Integer)
+    ingredient_id = Column(Integer, ForeignKey("ingredients.id"))
+    quantity = Column(Float)
+    unit = Column(String)
+    grams = Column(Float, nullable=True)
+
+    ingredient = relationship("Ingredient", lazy="joined")
+
+class RecipeVersion(Base):
+    """Immutable snapshot of a recipe and its per-serving totals, recorded by
+    RecipeVersionService whenever the recipe's content or totals change."""
+    __tablename__ = "recipe_versions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"))
+    version = Column(Integer)
+    created_at = Column(Float)
+    name = Column(String)
+    type = Column(Enum(RecipeType))
+    standard_serving_amount = Column(Float)
+    standard_serving_unit = Column(String)
+    nutrition_direct = Column(JSON, nullable=True)
+    ingredient_set_id = Column(Integer, ForeignKey("ingredient_sets.id"), nullable=True)
+    total_grams = Column(Float, default=0.0)
+    # One total_<nutrient> column per entry in NUTRIENTS, added below
+
+    ingredient_set = relationship("IngredientSet")
+
+    __table_args__ = (
+        UniqueConstraint("recipe_id", "version"),
+    )
+
+    @property
+    def nutrition(self):
+        return Recipe.nutrition.fget(self)
+
+    @property
+    def ingredients(self):
+        return self.ingredient_set.items if self.ingredient_set else []
+
 class FoodEntry(Base):
     __tablename__ = "food_entries"
 
     id = Column(Integer, primary_key=True, index=True)
-    recipe_id = Column(Integer, ForeignKey("recipes.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), default=DEFAULT_USER_ID)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), index=True)
+    # The recipe as it was when the entry was logged
+    recipe_version_id = Column(Integer, ForeignKey("recipe_versions.id"), nullable=True)
     serving_multiplier = Column(Float, default=1.0)
-    date = Column(String, index=True) # storing as YYYY-MM-DD for simplicity or datetime string
+    date = Column(Date)
     
     # Optional override
     nutrition_override = Column(JSON, nullable=True)
 
     recipe = relationship("Recipe", back_populates="food_entries")
 
+    __table_args__ = (
+        Index("ix_food_entries_user_id_date", "user_id", "date"),
+    )
+
+
+class AIAnalysisCache(Base):
+    __tablename__ = "ai_analysis_cache"
+
+    # sha256 over normalized image bytes, prompt hash and model name
+    key = Column(String, primary_key=True)
+    model = Column(String)
+    prompt_hash = Column(String)
+    perceptual_hash = Column(String, nullable=True, index=True)
+    result = Column(JSON)
+    size_bytes = Column(Integer, default=0)
+    created_at = Column(Float)
+    last_accessed_at = Column(Float, index=True)
+
+class DailyTotal(Base):
+    """Per-user, per-day nutrition rollup of food_entries, maintained by RollupService."""
+    __tablename__ = "daily_totals"
+
+    user_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    entry_count = Column(Integer, default=0)
+    # One column per entry in NUTRIENTS, added below
+
+# Per-nutrient columns are generated from NUTRIENTS
+for _nutrient in NUTRIENTS:
+    setattr(Ingredient, per_100g_column(_nutrient.key), Column(Float, default=0.0))
+    setattr(Recipe, total_column(_nutrient.key), Column(Float, default=0.0))
+    setattr(RecipeVersion, total_column(_nutrient.key), Column(Float, default=0.0))
+    setattr(DailyTotal, _nutrient.key, Column(Float, default=0.0))
+
+class CatalogVersion(Base):
+    """Single-row counter bumped by every recipe or ingredient write; the
+    HTTP validators (ETag / Last-Modified) of catalog reads derive from it."""
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=1)
+    updated_at = Column(Float)
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    name = Column(String, primary_key=True)
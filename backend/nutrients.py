@@ -0,0 +1,38 @@
+"""The nutrients the tracker knows about.
+
+Models, schemas and services derive their per-nutrient columns and fields from
+NUTRIENTS. To track another nutrient (fiber, sodium, ...) add it here; new
+columns are added to existing tables by init_db() and default to 0.
+"""
+from typing import NamedTuple
+
+class Nutrient(NamedTuple):
+    key: str
+    label: str
+    unit: str
+    # Decimals kept when a recipe's per-serving value is displayed
+    decimals: int = 1
+    # USDA FoodData Central nutrient ids / legacy numbers, for bulk imports
+    fdc_ids: tuple = ()
+
+NUTRIENTS = (
+    Nutrient("energy_kcal", "Energy", "kcal", 0, fdc_ids=("1008", "208", "2047", "2048")),
+    Nutrient("protein_g", "Protein", "g", fdc_ids=("1003", "203")),
+    Nutrient("carbs_g", "Carbs", "g", fdc_ids=("1005", "205")),
+    Nutrient("fat_g", "Fat", "g", fdc_ids=("1004", "204")),
+)
+
+NUTRIENT_KEYS = tuple(n.key for n in NUTRIENTS)
+
+def per_100g_column(key: str) -> str:
+    """Ingredient column holding a nutrient per 100 g, e.g. protein_g_100g."""
+    return f"{key}_100g"
+
+def total_column(key: str) -> str:
+    """Recipe column caching a nutrient per standard serving, e.g. total_protein_g."""
+    return f"total_{key}"
+
+def nutrition_from_dict(values) -> dict:
+    """Every known nutrient from a possibly partial dict, missing/null as 0."""
+    values = values or {}
+    return {k: float(values.get(k) or 0) for k in NUTRIENT_KEYS}
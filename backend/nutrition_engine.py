@@ -0,0 +1,84 @@
+"""Batch nutrition arithmetic on NumPy arrays.
+
+Nutrient values are rows of a float matrix with one column per entry in
+NUTRIENTS. Recipe totals come from an ingredients x nutrients matrix and a
+sparse recipes x ingredients quantity matrix (kept as COO triplets). Entry
+totals come from a gather of per-serving rows times the serving multipliers.
+Each is a handful of array operations, whether for one recipe or thousands.
+"""
+from typing import Iterable, Optional, Sequence
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .models import Ingredient, RecipeIngredient
+from .nutrients import NUTRIENT_KEYS, per_100g_column
+
+def as_matrix(rows: Iterable[Sequence], width: int = len(NUTRIENT_KEYS)) -> np.ndarray:
+    """Float matrix from rows of nutrient values; NULLs become 0."""
+    matrix = np.array(list(rows), dtype=float).reshape(-1, width)
+    return np.nan_to_num(matrix, copy=False)
+
+def recipe_totals(db: Session, recipe_ids: Sequence[int]):
+    """Summed ingredient nutrition and grams for each of recipe_ids, using each
+    link's resolved grams.
+
+    Returns (totals, grams): a len(recipe_ids) x nutrients matrix and a vector,
+    in recipe_ids order. Recipes without ingredients get zero rows.
+    """
+    recipe_ids = list(recipe_ids)
+    totals = np.zeros((len(recipe_ids), len(NUTRIENT_KEYS)))
+    grams = np.zeros(len(recipe_ids))
+    if not recipe_ids:
+        return totals, grams
+
+    columns = [getattr(Ingredient, per_100g_column(k)) for k in NUTRIENT_KEYS]
+    # Links written before unit conversion existed read quantity as grams
+    grams_column = func.coalesce(RecipeIngredient.grams, RecipeIngredient.quantity)
+    links = (
+        db.query(RecipeIngredient.recipe_id, grams_column, Ingredient.id, *columns)
+        .join(Ingredient, RecipeIngredient.ingredient_id == Ingredient.id)
+        .filter(RecipeIngredient.recipe_id.in_(recipe_ids))
+        .all()
+    )
+    if not links:
+        return totals, grams
+
+    # Each distinct ingredient becomes one row of the per-gram matrix
+    ingredient_rows = {link[2]: link[3:] for link in links}
+    ingredient_index = {ingredient_id: i for i, ingredient_id in enumerate(ingredient_rows)}
+    per_gram = as_matrix(ingredient_rows.values()) / 100.0
+
+    recipe_index = {recipe_id: i for i, recipe_id in enumerate(recipe_ids)}
+    rows = np.fromiter((recipe_index[link[0]] for link in links), dtype=np.intp, count=len(links))
+    cols = np.fromiter((ingredient_index[link[2]] for link in links), dtype=np.intp, count=len(links))
+    quantities = np.nan_to_num(np.array([link[1] for link in links], dtype=float))
+
+    # Sparse (recipes x ingredients) @ (ingredients x nutrients)
+    np.add.at(totals, rows, quantities[:, None] * per_gram[cols])
+    np.add.at(grams, rows, quantities)
+    return totals, grams
+
+def entry_totals(per_serving: np.ndarray, multipliers: Sequence[Optional[float]],
+                 overrides: Sequence[Optional[dict]]) -> np.ndarray:
+    """Nutrition of each entry from its recipe's per-serving row.
+
+    A nutrition_override replaces the per-serving values it names; the serving
+    multiplier (default 1) is applied on top.
+    """
+    values = np.array(per_serving, dtype=float, copy=True).reshape(-1, len(NUTRIENT_KEYS))
+    for row, override in enumerate(overrides):
+        if override:
+            for col, k in enumerate(NUTRIENT_KEYS):
+                if k in override:
+                    values[row, col] = float(override[k] or 0)
+    scale = np.array([1.0 if m is None else m for m in multipliers], dtype=float)
+    return values * scale[:, None]
+
+def group_sum(keys: Sequence, values: np.ndarray):
+    """Sum matrix rows sharing a key. Returns {key: (row_count, sums)}."""
+    index = {}
+    codes = np.fromiter((index.setdefault(k, len(index)) for k in keys), dtype=np.intp, count=len(keys))
+    sums = np.zeros((len(index), values.shape[1]))
+    np.add.at(sums, codes, values)
+    counts = np.bincount(codes, minlength=len(index))
+    return {k: (int(counts[i]), sums[i]) for k, i in index.items()}
@@ -0,0 +1,339 @@
+"""Sampling profiles of slow requests.
+
+While enabled, every request under one of the tracked path prefixes is
+sampled: a background thread reads the stacks of the threads serving it
+(sys._current_frames) every few milliseconds, and the SQL statements it issues
+are recorded with their durations. Requests that take longer than the
+threshold are written as JSON reports to a directory that keeps only the
+newest ones. Faster requests are discarded. Nothing is installed or sampled
+while disabled.
+
+A request's threads are the event loop thread, sampled only while the
+request's task is the one running there (routing, async handlers and the
+run_sync greenlets they wait on, response serialization), and the threadpool
+workers it runs SQL from (sync handlers and dependencies). Each worker points
+at the request and threadpool call of its latest statement, and is sampled
+only while that call is still on its stack, so a worker that has moved on to
+other requests isn't charged to this one. Work a sync handler does before its
+first query isn't seen.
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+import anyio
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_REQUEST_PROFILING = os.getenv("SLOW_REQUEST_PROFILING", "false").lower() == "true"
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "500"))
+# Comma-separated path prefixes; empty tracks every path
+SLOW_REQUEST_PATHS = os.getenv("SLOW_REQUEST_PATHS", "/recipes,/log")
+SLOW_REQUEST_DIR = os.getenv("SLOW_REQUEST_DIR", "./slow_requests")
+SLOW_REQUEST_MAX_FILES = int(os.getenv("SLOW_REQUEST_MAX_FILES", "50"))
+SLOW_REQUEST_SAMPLE_INTERVAL_MS = float(os.getenv("SLOW_REQUEST_SAMPLE_INTERVAL_MS", "5"))
+
+MAX_STATEMENTS = 500
+MAX_STATEMENT_CHARS = 2000
+MAX_STACK_DEPTH = 128
+TOP_STACKS = 200
+TOP_FUNCTIONS = 40
+
+# Leaf frames of a thread that is waiting rather than working
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+# Frames of the thread pools' worker loops, below the call they run
+_POOL_FILES = (
+    "threading.py",
+    os.path.join("anyio", "_backends", "_asyncio.py"),
+    os.path.join("concurrent", "futures", "thread.py"),
+)
+_REPORT_ID = re.compile(r"[0-9A-Za-z-]+")
+
+_current_trace = ContextVar("slow_request_trace", default=None)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    marker = path.rfind("site-packages" + os.sep)
+    if marker != -1:
+        path = path[marker + len("site-packages") + 1:]
+    elif path.startswith(_ROOT):
+        path = path[len(_ROOT):]
+    elif path.startswith(_STDLIB):
+        path = path[len(_STDLIB):]
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+class _Trace:
+    def __init__(self, scope):
+        # Sortable by start time, to the microsecond
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}{time.time_ns() // 1000 % 1_000_000:06d}-{uuid.uuid4().hex[:6]}"
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query = scope.get("query_string", b"").decode("latin-1")
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.loop_thread = threading.get_ident()
+        self.samples = Counter()
+        self.statements = []
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.status = 500
+        self.duration = 0.0
+
+    def add_statement(self, statement: str, seconds: float, error: Optional[str] = None):
+        self.db_queries += 1
+        self.db_seconds += seconds
+        if len(self.statements) < MAX_STATEMENTS:
+            row = {"sql": statement[:MAX_STATEMENT_CHARS], "duration_ms": round(seconds * 1000, 3)}
+            if error:
+                row["error"] = error
+            self.statements.append(row)
+
+    def report(self, interval_ms: float) -> dict:
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.samples.items():
+            self_counts[stack[-1]] += count
+            for label in set(stack):
+                total_counts[label] += count
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1),
+            "db_queries": self.db_queries,
+            "db_duration_ms": round(self.db_seconds * 1000, 1),
+            "statements": self.statements,
+            "profile": {
+                "interval_ms": interval_ms,
+                "samples": sum(self.samples.values()),
+                # Collapsed stacks (root;...;leaf), as read by flamegraph.pl and speedscope
+                "stacks": [
+                    {"stack": ";".join(stack), "count": count}
+                    for stack, count in self.samples.most_common(TOP_STACKS)
+                ],
+                "functions": [
+                    {"function": label, "self": self_counts[label], "total": count}
+                    for label, count in total_counts.most_common(TOP_FUNCTIONS)
+                ],
+            },
+        }
+
+def _stack(frame, entry_frame=None):
+    """Labels from the outermost frame to frame, or None when the thread is
+    idle or (given entry_frame) no longer inside that call."""
+    if frame.f_code.co_filename.endswith(_IDLE_FILES):
+        return None
+    labels, inside = [], entry_frame is None
+    while frame is not None:
+        if frame is entry_frame:
+            inside = True
+        if len(labels) < MAX_STACK_DEPTH:
+            labels.append(_frame_label(frame.f_code))
+        elif inside:
+            break
+        frame = frame.f_back
+    if not inside:
+        return None
+    labels.reverse()
+    return tuple(labels)
+
+def _pool_entry_frame(frame):
+    """The outermost frame of the call a pool worker thread is running."""
+    entry = None
+    while frame is not None:
+        if not frame.f_code.co_filename.endswith(_POOL_FILES):
+            entry = frame
+        frame = frame.f_back
+    return entry
+
+class SlowRequestProfiler:
+    def __init__(self, enabled: bool = SLOW_REQUEST_PROFILING, threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS,
+                 paths: str = SLOW_REQUEST_PATHS, directory: str = SLOW_REQUEST_DIR,
+                 max_files: int = SLOW_REQUEST_MAX_FILES, interval_ms: float = SLOW_REQUEST_SAMPLE_INTERVAL_MS):
+        self.threshold_ms = threshold_ms
+        self.paths = tuple(p.strip() for p in paths.split(",") if p.strip())
+        self.directory = directory
+        self.max_files = max_files
+        self.interval_ms = interval_ms
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._active = set()
+        # Worker thread id -> (trace, entry frame of the call that ran its latest statement)
+        self._workers = {}
+        self._sampler = None
+        self._hooks_installed = False
+        if enabled:
+            self.configure(enabled=True)
+
+    def configure(self, enabled: Optional[bool] = None, threshold_ms: Optional[float] = None):
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if enabled and not self._hooks_installed:
+            # Installed on first use; while disabled they return straight away
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(Engine, "handle_error", _handle_error)
+            self._hooks_installed = True
+        if enabled is not None:
+            self.enabled = enabled
+
+    def settings(self) -> dict:
+        return {"enabled": self.enabled, "threshold_ms": self.threshold_ms}
+
+    def tracks(self, path: str) -> bool:
+        return not self.paths or path.startswith(self.paths)
+
+    def start(self, scope) -> _Trace:
+        trace = _Trace(scope)
+        with self._lock:
+            self._active.add(trace)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="slow-request-sampler", daemon=True)
+                self._sampler.start()
+        return trace
+
+    def finish(self, trace: _Trace) -> bool:
+        """Stop sampling trace; True when it was slow enough to keep."""
+        trace.duration = time.perf_counter() - trace.started
+        with self._lock:
+            self._active.discard(trace)
+            for thread_id, (worker_trace, _) in list(self._workers.items()):
+                if worker_trace is trace:
+                    del self._workers[thread_id]
+        return trace.duration * 1000 >= self.threshold_ms
+
+    def bind_worker(self, trace: _Trace, entry_frame):
+        """Charge the calling worker thread to trace while entry_frame runs."""
+        with self._lock:
+            if trace in self._active:
+                self._workers[threading.get_ident()] = (trace, entry_frame)
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                traces = list(self._active)
+                workers = list(self._workers.items())
+                if not traces:
+                    self._sampler = None
+                    return
+            frames = sys._current_frames()
+            for trace in traces:
+                # Read outside the loop's thread, so this can be a step stale
+                if asyncio.current_task(trace.loop) is trace.task:
+                    frame = frames.get(trace.loop_thread)
+                    if frame is not None and (stack := _stack(frame)):
+                        trace.samples[stack] += 1
+            for thread_id, (trace, entry_frame) in workers:
+                frame = frames.get(thread_id)
+                if frame is not None and (stack := _stack(frame, entry_frame)):
+                    trace.samples[stack] += 1
+            del frames, workers
+            time.sleep(self.interval_ms / 1000)
+
+    def save(self, trace: _Trace):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{trace.id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(trace.report(self.interval_ms), f)
+        os.replace(tmp_path, path)
+        # Ids start with the timestamp, so name order is age order
+        for name in self._report_names()[:-self.max_files or None]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _report_names(self):
+        try:
+            return sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        except OSError:
+            return []
+
+    def list_reports(self):
+        """Summaries of the stored reports, newest first."""
+        summaries = []
+        for name in reversed(self._report_names()):
+            report = self.load_report(name[:-len(".json")])
+            if report is None:
+                continue
+            del report["statements"]
+            report["samples"] = report.pop("profile")["samples"]
+            summaries.append(report)
+        return summaries
+
+    def load_report(self, report_id: str) -> Optional[dict]:
+        if not _REPORT_ID.fullmatch(report_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{report_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+slow_requests = SlowRequestProfiler()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    if threading.get_ident() != trace.loop_thread:
+        slow_requests.bind_worker(trace, _pool_entry_frame(sys._getframe(1)))
+    conn.info.setdefault("slow_request_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    if trace is None or not conn.info.get("slow_request_started"):
+        return
+    trace.add_statement(statement, time.perf_counter() - conn.info["slow_request_started"].pop())
+
+def _handle_error(exception_context):
+    trace = _current_trace.get()
+    connection = exception_context.connection
+    if trace is None or connection is None or not connection.info.get("slow_request_started"):
+        return
+    started = connection.info["slow_request_started"].pop()
+    trace.add_statement(exception_context.statement or "", time.perf_counter() - started,
+                        error=type(exception_context.original_exception).__name__)
+
+class SlowRequestMiddleware:
+    """ASGI middleware sampling tracked requests while slow_requests is enabled."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not slow_requests.enabled or not slow_requests.tracks(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        trace = slow_requests.start(scope)
+        token = _current_trace.set(trace)
+
+        async def send_tracking(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_tracking)
+        finally:
+            _current_trace.reset(token)
+            if slow_requests.finish(trace):
+                # The response has been sent; keep file I/O off the event loop
+                await anyio.to_thread.run_sync(slow_requests.save, trace)
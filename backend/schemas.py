@@ -1,17 +1,26 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, create_model
 from typing import List, Optional
 from enum import Enum
+from .nutrients import NUTRIENT_KEYS, per_100g_column
+import datetime
 
 class RecipeType(str, Enum):
     GRANULAR = "GRANULAR"
     DIRECT = "DIRECT"
 
-class IngredientBase(BaseModel):
-    name: str
-    energy_kcal_100g: float
-    protein_g_100g: float
-    carbs_g_100g: float
-    fat_g_100g: float
+# One float field per nutrient in NUTRIENTS
+NutritionTotals = create_model(
+    "NutritionTotals", **{k: (float, 0.0) for k in NUTRIENT_KEYS}
+)
+
+IngredientBase = create_model(
+    "IngredientBase",
+    name=(str, ...),
+    # Required, like the name: a missing nutrient is an error, not a zero
+    **{per_100g_column(k): (float, ...) for k in NUTRIENT_KEYS},
+    density_g_per_ml=(Optional[float], None),
+    piece_weight_g=(Optional[float], None),
+)
 
 class IngredientCreate(IngredientBase):
     pass
@@ -21,18 +30,33 @@ class Ingredient(IngredientBase):
     class Config:
         from_attributes = True
 
+class IngredientMatch(BaseModel):
+    ingredient: Ingredient
+    score: float
+
 class RecipeIngredientBase(BaseModel):
     ingredient_name: str
     quantity: float
     unit: str
     nutrition_per_100g: Optional[dict] = None
+    # Stored on the ingredient when it is created by this request, or when
+    # an existing one has no value yet; stored values are never overwritten
+    density_g_per_ml: Optional[float] = None
+    piece_weight_g: Optional[float] = None
     # Add calculated totals for convenience in UI
     # We can't easily inject these from ORM without property methods
     # So for now, we'll stick to basics or use a nested Ingredient object
 
+class RecipeIngredientsPatch(BaseModel):
+    # Added, or replacing the quantity and unit of the same ingredient
+    upsert: List[RecipeIngredientBase] = []
+    # Ingredient names to drop from the recipe
+    remove: List[str] = []
+
 class RecipeIngredientDisplay(BaseModel):
     quantity: float
     unit: str
+    grams: Optional[float] = None
     ingredient: Ingredient
 
     class Config:
@@ -46,12 +70,20 @@ class RecipeCreate(BaseModel):
     nutrition_direct: Optional[dict] = None
     ingredients: Optional[List[RecipeIngredientBase]] = []
 
-class Recipe(BaseModel):
+class RecipeSummary(BaseModel):
     id: int
     name: str
     type: RecipeType
     standard_serving_amount: float
     standard_serving_unit: str
+    # Cached per-serving totals, so clients don't need to re-sum ingredients
+    nutrition: Optional[NutritionTotals] = None
+    total_grams: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+class Recipe(RecipeSummary):
     nutrition_direct: Optional[dict] = None
     # Use the display schema which includes the full Ingredient object
     ingredients: List[RecipeIngredientDisplay] = []
@@ -59,13 +91,133 @@ class Recipe(BaseModel):
     class Config:
         from_attributes = True
 
+class RecipeVersionSummary(BaseModel):
+    version: int
+    created_at: float
+    name: str
+    type: RecipeType
+    standard_serving_amount: float
+    standard_serving_unit: str
+    nutrition: Optional[NutritionTotals] = None
+    total_grams: Optional[float] = None
+    # Versions with the same ingredient list share a set
+    ingredient_set_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class RecipeVersion(RecipeVersionSummary):
+    nutrition_direct: Optional[dict] = None
+    ingredients: List[RecipeIngredientDisplay] = []
+
+    class Config:
+        from_attributes = True
+
+def parse_recipe_fields(fields: Optional[str]):
+    """Parse a fields=a,b,c query value into a set of Recipe field names.
+
+    Returns None when no selection was given; raises ValueError on unknown names.
+    """
+    if not fields:
+        return None
+    include = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = include - set(Recipe.model_fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return include
+
+def dump_recipes(recipes, summary: bool = False, include=None):
+    schema = RecipeSummary if summary else Recipe
+    return [schema.model_validate(r).model_dump(include=include) for r in recipes]
+
+class UserCreate(BaseModel):
+    name: str
+
+class User(UserCreate):
+    id: int
+
+    class Config:
+        from_attributes = True
+
 class FoodEntryCreate(BaseModel):
     recipe_id: int
     serving_multiplier: float = 1.0
     nutrition_override: Optional[dict] = None
-    date: str
+    date: datetime.date
 
 class FoodEntry(FoodEntryCreate):
     id: int
+    recipe_version_id: Optional[int] = None
     class Config:
         from_attributes = True
+
+class TrendPoint(BaseModel):
+    period_start: datetime.date
+    days_logged: int
+    entry_count: int
+    totals: NutritionTotals
+    daily_average: NutritionTotals
+
+class FoodEntryBatchError(BaseModel):
+    index: int
+    detail: str
+
+class FoodEntryBatchResult(BaseModel):
+    created_ids: List[int] = []
+    errors: List[FoodEntryBatchError] = []
+
+class FoodEntryNutrition(BaseModel):
+    id: int
+    recipe_id: int
+    recipe_name: str
+    serving_multiplier: float
+    nutrition: NutritionTotals
+
+class DailySummary(BaseModel):
+    date: datetime.date
+    entries: List[FoodEntryNutrition] = []
+    totals: NutritionTotals
+
+class AnalysisJob(BaseModel):
+    id: str
+    status: str
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    preprocessing: Optional[dict] = None
+    finished_at: Optional[float] = None
+
+class AnalysisQueueStats(BaseModel):
+    queue_depth: int
+    running: int
+    max_workers: int
+    max_queue: int
+    completed: int
+    failed: int
+    rejected: int
+
+class AnalysisCacheStats(BaseModel):
+    entries: int
+    size_bytes: int
+    max_bytes: int
+    hits: int
+    near_hits: int
+    misses: int
+    bypassed: int
+    evictions: int
+    hit_ratio: float
+
+class SlowRequestSettings(BaseModel):
+    enabled: bool
+    threshold_ms: float = Field(gt=0)
+
+class SlowRequestSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    query: str
+    status: int
+    started_at: float
+    duration_ms: float
+    db_queries: int
+    db_duration_ms: float
+    samples: int
@@ -1,37 +1,143 @@
-from sqlalchemy.orm import Session
-from .models import Ingredient, Recipe, RecipeIngredient, RecipeType, FoodEntry
-from .schemas import RecipeCreate, IngredientCreate
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, noload, selectinload
+from .models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeType, FoodEntry, DailyTotal, CatalogVersion, User,
+    IngredientSet, IngredientSetItem, RecipeVersion
+)
+from .schemas import RecipeCreate, IngredientCreate, FoodEntryCreate, RecipeIngredientBase, RecipeIngredientsPatch, UserCreate
+from .nutrients import NUTRIENT_KEYS, per_100g_column, total_column, nutrition_from_dict
+from .units import UnitConversionError, to_grams
+from .ingredient_index import ingredient_index, normalize_name
+from . import nutrition_engine
+import hashlib
+import json
 import math
+import time
+import datetime
+import itertools
+from typing import List
+
+class IngredientNotInRecipeError(ValueError):
+    pass
+
+class IngredientNameTakenError(ValueError):
+    pass
+
+def upsert_insert(db: Session, model):
+    """INSERT construct supporting ON CONFLICT for the session's dialect."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+class CatalogService:
+    @staticmethod
+    def current(db: Session):
+        # The row is seeded by a migration; an unsaved stand-in covers its absence
+        return db.get(CatalogVersion, 1) or CatalogVersion(id=1, version=0, updated_at=0.0)
+
+    @staticmethod
+    def bump(db: Session):
+        """Mark the catalog changed, in the caller's transaction."""
+        updated = db.query(CatalogVersion).filter(CatalogVersion.id == 1).update(
+            {CatalogVersion.version: CatalogVersion.version + 1, CatalogVersion.updated_at: time.time()},
+            synchronize_session=False,
+        )
+        if not updated:
+            db.add(CatalogVersion(id=1, version=1, updated_at=time.time()))
+
+class UserService:
+    @staticmethod
+    def create_user(db: Session, user: UserCreate):
+        """Create a user, or return None when the name is taken."""
+        if db.query(User.id).filter(User.name == user.name).first():
+            return None
+        db_user = User(name=user.name)
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+        return db_user
+
+    @staticmethod
+    def get_user(db: Session, user_id: int):
+        return db.get(User, user_id)
 
 class NutritionService:
     @staticmethod
     def calculate_recipe_nutrition(recipe: Recipe, db: Session):
         if recipe.type == RecipeType.DIRECT:
             return recipe.nutrition_direct or {}
-        
-        total_nutrition = {
-            "energy_kcal": 0.0,
-            "protein_g": 0.0,
-            "carbs_g": 0.0,
-            "fat_g": 0.0
-        }
-        
-        for item in recipe.ingredients:
-            qty_factor = item.quantity / 100.0  # Nutrition is per 100g
-            ingredient = item.ingredient
-            if ingredient:
-                total_nutrition["energy_kcal"] += ingredient.energy_kcal_100g * qty_factor
-                total_nutrition["protein_g"] += ingredient.protein_g_100g * qty_factor
-                total_nutrition["carbs_g"] += ingredient.carbs_g_100g * qty_factor
-                total_nutrition["fat_g"] += ingredient.fat_g_100g * qty_factor
-                
-        # Rounding
-        return {
-            "energy_kcal": round(total_nutrition["energy_kcal"]),
-            "protein_g": round(total_nutrition["protein_g"], 1),
-            "carbs_g": round(total_nutrition["carbs_g"], 1),
-            "fat_g": round(total_nutrition["fat_g"], 1)
-        }
+        return recipe.nutrition
+
+    @staticmethod
+    def refresh_recipe_totals(db: Session, recipe: Recipe):
+        """Recompute the cached totals of a single recipe. The caller commits."""
+        db.flush()
+        NutritionService.refresh_totals_for_recipes(db, [recipe.id])
+
+    @staticmethod
+    def refresh_totals_for_recipes(db: Session, recipe_ids, snapshot: bool = True):
+        """Recompute cached totals for the given recipes in one batch.
+
+        GRANULAR recipes are summed from their ingredients by the NumPy engine,
+        DIRECT recipes mirror nutrition_direct. Recipes whose content or totals
+        changed get a new version, unless snapshot is False (migrations that
+        run before versions exist). Changes are flushed in the caller's
+        transaction.
+        """
+        recipe_ids = list(set(recipe_ids))
+        if not recipe_ids:
+            return
+
+        totals, grams = nutrition_engine.recipe_totals(db, recipe_ids)
+        row_for = {recipe_id: i for i, recipe_id in enumerate(recipe_ids)}
+
+        for recipe in db.query(Recipe).filter(Recipe.id.in_(recipe_ids)):
+            if recipe.type == RecipeType.DIRECT:
+                values = nutrition_from_dict(recipe.nutrition_direct)
+            else:
+                row = row_for[recipe.id]
+                values = dict(zip(NUTRIENT_KEYS, totals[row].tolist()))
+                recipe.total_grams = float(grams[row])
+            for k, v in values.items():
+                setattr(recipe, total_column(k), v)
+        db.flush()
+
+        # Entries already logged keep the version they were logged against,
+        # so their days' rollups stay valid
+        if snapshot:
+            RecipeVersionService.snapshot(db, recipe_ids)
+
+    @staticmethod
+    def refresh_link_grams(db: Session, ingredient_ids=None, strict: bool = True):
+        """Re-resolve RecipeIngredient.grams for links to the given ingredients
+        (all links when None), e.g. after a density or piece weight change.
+
+        Unconvertible units raise UnitConversionError, or with strict=False keep
+        the old reading of quantity as grams. Returns the affected recipe ids.
+        """
+        query = db.query(RecipeIngredient.id, RecipeIngredient.recipe_id, RecipeIngredient.quantity,
+                         RecipeIngredient.unit, RecipeIngredient.grams, Ingredient)
+        query = query.join(Ingredient, RecipeIngredient.ingredient_id == Ingredient.id)
+        if ingredient_ids is not None:
+            query = query.filter(RecipeIngredient.ingredient_id.in_(list(ingredient_ids)))
+
+        changes, recipe_ids = [], set()
+        for link_id, recipe_id, quantity, unit, grams, ingredient in query:
+            try:
+                resolved = to_grams(quantity, unit, ingredient)
+            except UnitConversionError as e:
+                if strict:
+                    raise UnitConversionError(f"{ingredient.name}: {e}")
+                resolved = quantity
+            if resolved != grams:
+                changes.append({"id": link_id, "grams": resolved})
+                recipe_ids.add(recipe_id)
+        if changes:
+            db.execute(update(RecipeIngredient), changes)
+        return recipe_ids
 
 class IngredientService:
     @staticmethod
@@ -42,18 +148,140 @@ class IngredientService:
     def create_ingredient(db: Session, ingredient: IngredientCreate):
         db_ingredient = Ingredient(**ingredient.dict())
         db.add(db_ingredient)
+        CatalogService.bump(db)
         db.commit()
         db.refresh(db_ingredient)
         return db_ingredient
     
+    @staticmethod
+    def resolve_ingredients(db: Session, items: List[RecipeIngredientBase]):
+        """Map each item's ingredient_name to an Ingredient row.
+
+        Existing rows are fetched with one IN query, also matching names that
+        differ only in case or punctuation through the ingredient index.
+        Missing ones are inserted in a single INSERT ... ON CONFLICT DO NOTHING
+        (so concurrent creators of the same name don't fail) and then fetched.
+        A density or piece weight sent for an existing ingredient that has
+        none yet is stored on it. Nothing is committed here.
+        """
+        names = {item.ingredient_name for item in items}
+        if not names:
+            return {}
+        found = {i.name: i for i in db.query(Ingredient).filter(Ingredient.name.in_(names))}
+
+        unmatched = names - found.keys()
+        if unmatched:
+            # Before the inserts below, so only committed rows are indexed
+            ingredient_index.refresh(db)
+        near_names = {
+            name: ingredient_id for name in unmatched
+            if (ingredient_id := ingredient_index.find_normalized(name)) is not None
+        }
+        if near_names:
+            by_id = {i.id: i for i in db.query(Ingredient).filter(Ingredient.id.in_(near_names.values()))}
+            found.update({
+                name: by_id[ingredient_id] for name, ingredient_id in near_names.items() if ingredient_id in by_id
+            })
+
+        missing = {}
+        for item in items:
+            if item.ingredient_name in found or item.ingredient_name in missing:
+                continue
+            nutrition = nutrition_from_dict(item.nutrition_per_100g)
+            missing[item.ingredient_name] = {
+                "name": item.ingredient_name,
+                **{per_100g_column(k): v for k, v in nutrition.items()},
+                "density_g_per_ml": item.density_g_per_ml,
+                "piece_weight_g": item.piece_weight_g,
+            }
+
+        if missing:
+            stmt = upsert_insert(db, Ingredient).values(list(missing.values()))
+            db.execute(stmt.on_conflict_do_nothing(index_elements=["name"]))
+            found.update({
+                i.name: i for i in db.query(Ingredient).filter(Ingredient.name.in_(missing))
+            })
+
+        # Fill in conversion properties, never overwrite them
+        filled_ids = set()
+        for item in items:
+            ingredient = found[item.ingredient_name]
+            for key in ("density_g_per_ml", "piece_weight_g"):
+                value = getattr(item, key)
+                if value and not getattr(ingredient, key):
+                    setattr(ingredient, key, value)
+                    filled_ids.add(ingredient.id)
+        if filled_ids:
+            db.flush()
+            # Volume links of other recipes were read at water density until now
+            recipe_ids = NutritionService.refresh_link_grams(db, filled_ids, strict=False)
+            NutritionService.refresh_totals_for_recipes(db, recipe_ids)
+            CatalogService.bump(db)
+        return found
+
+    @staticmethod
+    def update_ingredient(db: Session, ingredient_id: int, ingredient: IngredientCreate):
+        """Update an ingredient, or return None when it doesn't exist.
+
+        Fields left out of the request, such as the density or piece weight,
+        keep their stored values. Raises IngredientNameTakenError when renamed
+        to another ingredient's name.
+        """
+        db_ingredient = db.query(Ingredient).filter(Ingredient.id == ingredient_id).first()
+        if not db_ingredient:
+            return None
+        taken = db.query(Ingredient.id).filter(Ingredient.name == ingredient.name, Ingredient.id != ingredient_id)
+        if taken.first():
+            raise IngredientNameTakenError(f"Ingredient '{ingredient.name}' already exists")
+        conversion = (db_ingredient.density_g_per_ml, db_ingredient.piece_weight_g)
+        for key, value in ingredient.dict(exclude_unset=True).items():
+            setattr(db_ingredient, key, value)
+        try:
+            db.flush()
+        except IntegrityError:
+            # Taken by a concurrent insert or rename since the check
+            db.rollback()
+            raise IngredientNameTakenError(f"Ingredient '{ingredient.name}' already exists")
+
+        # A new density or piece weight changes the grams of its recipe links;
+        # legacy units that can't be converted keep their grams
+        if (db_ingredient.density_g_per_ml, db_ingredient.piece_weight_g) != conversion:
+            NutritionService.refresh_link_grams(db, [ingredient_id], strict=False)
+
+        # Only recipes that use this ingredient need their cached totals recomputed
+        recipe_ids = [
+            row[0] for row in db.query(RecipeIngredient.recipe_id)
+            .filter(RecipeIngredient.ingredient_id == ingredient_id)
+            .distinct()
+        ]
+        NutritionService.refresh_totals_for_recipes(db, recipe_ids)
+        CatalogService.bump(db)
+        db.commit()
+        db.refresh(db_ingredient)
+        ingredient_index.rename(db_ingredient.id, db_ingredient.name)
+        return db_ingredient
+
     @staticmethod
     def list_ingredients(db: Session, skip: int = 0, limit: int = 100):
         return db.query(Ingredient).offset(skip).limit(limit).all()
 
+    @staticmethod
+    def search_ingredients(db: Session, query: str, limit: int = 10):
+        """Ranked fuzzy/prefix matches for `query` from the ingredient index."""
+        matches = ingredient_index.search(db, query, limit)
+        rows = {
+            i.id: i for i in db.query(Ingredient).filter(Ingredient.id.in_([m[0] for m in matches]))
+        } if matches else {}
+        return [
+            {"ingredient": rows[ingredient_id], "score": score}
+            for ingredient_id, _, score in matches if ingredient_id in rows
+        ]
+
 class RecipeService:
     @staticmethod
-    def create_recipe(db: Session, recipe: RecipeCreate):
+    def create_recipe(db: Session, recipe: RecipeCreate, user_id: int):
         db_recipe = Recipe(
+            user_id=user_id,
             name=recipe.name, 
             type=recipe.type,
             standard_serving_amount=recipe.standard_serving_amount,
@@ -61,48 +289,256 @@ class RecipeService:
             nutrition_direct=recipe.nutrition_direct
         )
         db.add(db_recipe)
-        db.commit()
-        db.refresh(db_recipe)
+        db.flush()
         
         if recipe.type == RecipeType.GRANULAR and recipe.ingredients:
-            for item in recipe.ingredients:
-                ingredient = db.query(Ingredient).filter(Ingredient.name == item.ingredient_name).first()
-                
-                if not ingredient:
-                    # Create ingredient if missing
-                    nutrition = item.nutrition_per_100g or {}
-                    ing_create = IngredientCreate(
-                        name=item.ingredient_name,
-                        energy_kcal_100g=nutrition.get('energy_kcal', 0),
-                        protein_g_100g=nutrition.get('protein_g', 0),
-                        carbs_g_100g=nutrition.get('carbs_g', 0),
-                        fat_g_100g=nutrition.get('fat_g', 0)
-                    )
-                    ingredient = IngredientService.create_ingredient(db, ing_create)
-                    
-                db_item = RecipeIngredient(
-                    recipe_id=db_recipe.id,
-                    ingredient_id=ingredient.id,
-                    quantity=item.quantity,
-                    unit=item.unit
-                )
-                db.add(db_item)
-            db.commit()
-            db.refresh(db_recipe)
-            
-        return db_recipe
+            RecipeService.add_ingredients(db, db_recipe, recipe.ingredients)
+
+        NutritionService.refresh_recipe_totals(db, db_recipe)
+        CatalogService.bump(db)
+        db.commit()
+        return RecipeService.reload_recipe(db, db_recipe.id)
+
+    @staticmethod
+    def update_recipe(db: Session, db_recipe: Recipe, recipe: RecipeCreate):
+        db_recipe.name = recipe.name
+        db_recipe.standard_serving_amount = recipe.standard_serving_amount
+        db_recipe.standard_serving_unit = recipe.standard_serving_unit
+        db_recipe.type = recipe.type
+        db_recipe.nutrition_direct = recipe.nutrition_direct
+        
+        # Update ingredients if provided, writing only the rows that differ
+        if recipe.type == RecipeType.GRANULAR and recipe.ingredients is not None:
+            RecipeService.sync_ingredients(db, db_recipe, recipe.ingredients)
+
+        NutritionService.refresh_recipe_totals(db, db_recipe)
+        CatalogService.bump(db)
+        db.commit()
+        return RecipeService.reload_recipe(db, db_recipe.id)
+
+    @staticmethod
+    def add_ingredients(db: Session, db_recipe: Recipe, items: List[RecipeIngredientBase]):
+        """Insert the recipe's ingredient links with quantities resolved to grams.
+
+        Raises UnitConversionError for a unit that can't be converted.
+        """
+        # Ingredients missing from the catalog are created in the same transaction
+        ingredients = IngredientService.resolve_ingredients(db, items)
+        rows = [RecipeService._link_row(db_recipe, ingredients[item.ingredient_name], item) for item in items]
+        db.execute(insert(RecipeIngredient), rows)
+
+    @staticmethod
+    def _link_row(db_recipe: Recipe, ingredient: Ingredient, item: RecipeIngredientBase):
+        try:
+            grams = to_grams(item.quantity, item.unit, ingredient)
+        except UnitConversionError as e:
+            raise UnitConversionError(f"{item.ingredient_name}: {e}")
+        return {
+            "recipe_id": db_recipe.id,
+            "ingredient_id": ingredient.id,
+            "quantity": item.quantity,
+            "unit": item.unit,
+            "grams": grams
+        }
+
+    @staticmethod
+    def _link_unchanged(link, item: RecipeIngredientBase) -> bool:
+        # Same quantity and unit: the stored grams stand, even for a legacy
+        # unit that to_grams no longer converts
+        return (link.quantity, link.unit) == (item.quantity, item.unit)
+
+    @staticmethod
+    def _links_by_ingredient(db: Session, recipe_id: int):
+        # Ingredient id -> the recipe's links to it, oldest first
+        links = {}
+        for link in (
+            db.query(RecipeIngredient.id, RecipeIngredient.ingredient_id, RecipeIngredient.quantity,
+                     RecipeIngredient.unit, RecipeIngredient.grams)
+            .filter(RecipeIngredient.recipe_id == recipe_id)
+            .order_by(RecipeIngredient.id)
+        ):
+            links.setdefault(link.ingredient_id, []).append(link)
+        return links
+
+    @staticmethod
+    def _write_link_changes(db: Session, inserts, updates, delete_ids):
+        """Apply a computed diff to recipe_ingredients. Returns the rows written."""
+        if updates:
+            db.execute(update(RecipeIngredient), updates)
+        if inserts:
+            db.execute(insert(RecipeIngredient), inserts)
+        if delete_ids:
+            db.query(RecipeIngredient).filter(RecipeIngredient.id.in_(delete_ids)).delete(synchronize_session=False)
+        return len(updates) + len(inserts) + len(delete_ids)
+
+    @staticmethod
+    def sync_ingredients(db: Session, db_recipe: Recipe, items: List[RecipeIngredientBase]):
+        """Make the recipe's ingredient links match items, touching only what
+        changed: links are matched by ingredient (repeats of one ingredient in
+        order), changed ones updated in place, new ones inserted and the rest
+        deleted. Returns the number of rows written; nothing is committed.
+
+        Raises UnitConversionError for a new or changed unit that can't be
+        converted.
+        """
+        ingredients = IngredientService.resolve_ingredients(db, items)
+        existing = RecipeService._links_by_ingredient(db, db_recipe.id)
+
+        inserts, updates = [], []
+        for item in items:
+            ingredient = ingredients[item.ingredient_name]
+            links = existing.get(ingredient.id)
+            if not links:
+                inserts.append(RecipeService._link_row(db_recipe, ingredient, item))
+                continue
+            link = links.pop(0)
+            if RecipeService._link_unchanged(link, item):
+                continue
+            row = RecipeService._link_row(db_recipe, ingredient, item)
+            updates.append({"id": link.id, "quantity": row["quantity"], "unit": row["unit"], "grams": row["grams"]})
+        delete_ids = [link.id for links in existing.values() for link in links]
+        return RecipeService._write_link_changes(db, inserts, updates, delete_ids)
+
+    @staticmethod
+    def patch_ingredients(db: Session, db_recipe: Recipe, changes: RecipeIngredientsPatch):
+        """Apply partial ingredient changes to a GRANULAR recipe: each upsert
+        item sets its ingredient's quantity and unit (adding the ingredient if
+        absent), and names in remove are dropped; a name in both is removed.
+        Names match like in resolve_ingredients, also ignoring case and
+        punctuation. Unchanged links are not touched.
+
+        Raises IngredientNotInRecipeError for a name in remove that matches
+        none of the recipe's ingredients.
+        """
+        ingredients = IngredientService.resolve_ingredients(db, changes.upsert)
+        existing = RecipeService._links_by_ingredient(db, db_recipe.id)
+        removed = RecipeService._match_removed(
+            db, changes.remove, set(existing) | {i.id for i in ingredients.values()}
+        )
+
+        # The last change to an ingredient wins
+        latest = {ingredients[item.ingredient_name].id: item for item in changes.upsert}
+
+        inserts, updates, delete_ids = [], [], []
+        for ingredient_id, item in latest.items():
+            if ingredient_id in removed:
+                continue
+            ingredient = ingredients[item.ingredient_name]
+            links = existing.get(ingredient_id)
+            if not links:
+                inserts.append(RecipeService._link_row(db_recipe, ingredient, item))
+                continue
+            # The ingredient ends up with a single link
+            link, *repeats = links
+            delete_ids.extend(repeat.id for repeat in repeats)
+            if not RecipeService._link_unchanged(link, item):
+                row = RecipeService._link_row(db_recipe, ingredient, item)
+                updates.append({"id": link.id, "quantity": row["quantity"], "unit": row["unit"], "grams": row["grams"]})
+        for ingredient_id in removed:
+            delete_ids.extend(link.id for link in existing.get(ingredient_id, []))
+
+        if RecipeService._write_link_changes(db, inserts, updates, delete_ids):
+            NutritionService.refresh_recipe_totals(db, db_recipe)
+            CatalogService.bump(db)
+        db.commit()
+        return RecipeService.reload_recipe(db, db_recipe.id)
+
+    @staticmethod
+    def _match_removed(db: Session, names: List[str], ingredient_ids):
+        """Ids among ingredient_ids named by names, matched exactly or else by
+        normalized name."""
+        if not names:
+            return set()
+        by_name, by_normalized = {}, {}
+        for ingredient_id, name in db.query(Ingredient.id, Ingredient.name).filter(Ingredient.id.in_(ingredient_ids)):
+            by_name[name] = ingredient_id
+            by_normalized.setdefault(normalize_name(name), ingredient_id)
+
+        removed, unknown = set(), []
+        for name in names:
+            ingredient_id = by_name.get(name, by_normalized.get(normalize_name(name)))
+            if ingredient_id is None:
+                unknown.append(name)
+            else:
+                removed.add(ingredient_id)
+        if unknown:
+            raise IngredientNotInRecipeError(f"Not in this recipe: {', '.join(unknown)}")
+        return removed
+
+    @staticmethod
+    def query_with_ingredients(db: Session):
+        # One extra SELECT ... IN for all ingredient links (joined to their
+        # ingredient), instead of a lazy load per recipe and per link
+        return db.query(Recipe).options(
+            selectinload(Recipe.ingredients).joinedload(RecipeIngredient.ingredient)
+        )
 
     @staticmethod
-    def get_recipe(db: Session, recipe_id: int):
-        return db.query(Recipe).filter(Recipe.id == recipe_id).first()
+    def get_recipe(db: Session, recipe_id: int, user_id: int):
+        return (
+            RecipeService.query_with_ingredients(db)
+            .filter(Recipe.id == recipe_id, Recipe.user_id == user_id)
+            .first()
+        )
 
     @staticmethod
-    def list_recipes(db: Session):
-        return db.query(Recipe).all()
+    def delete_recipe(db: Session, recipe: Recipe):
+        affected_days = RollupService.days_for_recipes(db, [recipe.id])
+
+        # Manually delete associated food entries first (simulating cascade)
+        db.query(FoodEntry).filter(FoodEntry.recipe_id == recipe.id).delete()
+        # Ingredient sets may be shared with other recipes' versions, so they stay
+        db.query(RecipeVersion).filter(RecipeVersion.recipe_id == recipe.id).delete()
+        db.delete(recipe)
+        db.flush()
+
+        RollupService.refresh_days(db, affected_days)
+        CatalogService.bump(db)
+        db.commit()
+
+    @staticmethod
+    def reload_recipe(db: Session, recipe_id: int):
+        # Re-read after a commit with ingredients eagerly loaded for the response
+        return (
+            RecipeService.query_with_ingredients(db)
+            .populate_existing()
+            .filter(Recipe.id == recipe_id)
+            .first()
+        )
+
+    @staticmethod
+    def list_recipes(db: Session, user_id: int, cursor: int = None, limit: int = None, name_prefix: str = None,
+                     recipe_type: RecipeType = None, with_ingredients: bool = True):
+        """Keyset-paginated listing of a user's recipes ordered by id.
+
+        Returns (recipes, next_cursor); next_cursor is None on the last page.
+        """
+        if with_ingredients:
+            query = RecipeService.query_with_ingredients(db)
+        else:
+            query = db.query(Recipe).options(noload(Recipe.ingredients))
+        query = query.filter(Recipe.user_id == user_id)
+        if cursor is not None:
+            query = query.filter(Recipe.id > cursor)
+        if name_prefix:
+            query = query.filter(Recipe.name.startswith(name_prefix, autoescape=True))
+        if recipe_type:
+            query = query.filter(Recipe.type == recipe_type)
+        query = query.order_by(Recipe.id)
+
+        if limit is None:
+            return query.all(), None
+
+        # Fetch one extra row to know whether another page exists
+        recipes = query.limit(limit + 1).all()
+        if len(recipes) > limit:
+            recipes = recipes[:limit]
+            return recipes, recipes[-1].id
+        return recipes, None
         
     @staticmethod
-    def flatten_recipe(db: Session, recipe_id: int):
-        recipe = db.query(Recipe).filter(Recipe.id == recipe_id).first()
+    def flatten_recipe(db: Session, recipe_id: int, user_id: int):
+        recipe = db.query(Recipe).filter(Recipe.id == recipe_id, Recipe.user_id == user_id).first()
         if not recipe or recipe.type == RecipeType.DIRECT:
             return recipe
             
@@ -110,10 +546,403 @@ class RecipeService:
         
         recipe.type = RecipeType.DIRECT
         recipe.nutrition_direct = nutrition
-        # Ideally we archive the ingredients instead of deleting if we want audit/undo
-        # For this MVP, we'll just delete the links
+        # The previous version keeps the ingredient list and can be restored
         db.query(RecipeIngredient).filter(RecipeIngredient.recipe_id == recipe.id).delete()
+        NutritionService.refresh_recipe_totals(db, recipe)
+        CatalogService.bump(db)
         
         db.commit()
         db.refresh(recipe)
         return recipe
+
+    @staticmethod
+    def restore_version(db: Session, db_recipe: Recipe, version: RecipeVersion):
+        """Make a past version's content current again, recorded as a new version.
+
+        Quantities are converted to grams and totals recomputed from the
+        ingredients as they are now. Raises UnitConversionError when a unit no
+        longer converts.
+        """
+        db_recipe.name = version.name
+        db_recipe.type = version.type
+        db_recipe.standard_serving_amount = version.standard_serving_amount
+        db_recipe.standard_serving_unit = version.standard_serving_unit
+        db_recipe.nutrition_direct = version.nutrition_direct
+
+        db.query(RecipeIngredient).filter(RecipeIngredient.recipe_id == db_recipe.id).delete()
+        if version.ingredients:
+            db.execute(insert(RecipeIngredient), [
+                RecipeService._link_row(db_recipe, item.ingredient, RecipeIngredientBase(
+                    ingredient_name=item.ingredient.name, quantity=item.quantity, unit=item.unit
+                ))
+                for item in version.ingredients
+            ])
+
+        NutritionService.refresh_recipe_totals(db, db_recipe)
+        CatalogService.bump(db)
+        db.commit()
+        return RecipeService.reload_recipe(db, db_recipe.id)
+
+VERSIONED_FIELDS = (
+    "name", "type", "standard_serving_amount", "standard_serving_unit", "nutrition_direct", "total_grams",
+    *(total_column(k) for k in NUTRIENT_KEYS),
+)
+
+def _ingredient_set_digest(items) -> str:
+    return hashlib.sha256(json.dumps(items, separators=(",", ":")).encode()).hexdigest()
+
+class RecipeVersionService:
+    @staticmethod
+    def snapshot(db: Session, recipe_ids):
+        """Record a new version of each recipe whose content or cached totals
+        differ from its current version, and point the recipe at it.
+
+        Ingredient lists are stored once per distinct content and shared by
+        every version that has it. Flushed in the caller's transaction;
+        returns the number of versions added.
+        """
+        recipe_ids = list(set(recipe_ids))
+        if not recipe_ids:
+            return 0
+
+        items = {}
+        for row in (
+            db.query(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id, RecipeIngredient.quantity,
+                     RecipeIngredient.unit, RecipeIngredient.grams)
+            .filter(RecipeIngredient.recipe_id.in_(recipe_ids))
+            .order_by(RecipeIngredient.id)
+        ):
+            items.setdefault(row.recipe_id, []).append(list(row[1:]))
+        digests = {recipe_id: _ingredient_set_digest(recipe_items) for recipe_id, recipe_items in items.items()}
+        set_ids = RecipeVersionService._intern_sets(
+            db, {digests[recipe_id]: recipe_items for recipe_id, recipe_items in items.items()}
+        )
+
+        recipes = db.query(Recipe).filter(Recipe.id.in_(recipe_ids)).all()
+        current_ids = [recipe.current_version_id for recipe in recipes if recipe.current_version_id]
+        current = {
+            version.id: version
+            for version in db.query(RecipeVersion).filter(RecipeVersion.id.in_(current_ids))
+        } if current_ids else {}
+
+        changed, rows = [], []
+        now = time.time()
+        for recipe in recipes:
+            values = {field: getattr(recipe, field) for field in VERSIONED_FIELDS}
+            values["ingredient_set_id"] = set_ids.get(digests.get(recipe.id))
+            previous = current.get(recipe.current_version_id)
+            if previous and all(getattr(previous, field) == value for field, value in values.items()):
+                continue
+            changed.append(recipe)
+            rows.append(dict(values, recipe_id=recipe.id, version=previous.version + 1 if previous else 1,
+                             created_at=now))
+        if not rows:
+            return 0
+
+        version_ids = db.scalars(
+            insert(RecipeVersion).returning(RecipeVersion.id, sort_by_parameter_order=True), rows
+        ).all()
+        for recipe, version_id in zip(changed, version_ids):
+            recipe.current_version_id = version_id
+        db.flush()
+        return len(rows)
+
+    @staticmethod
+    def _intern_sets(db: Session, items_by_digest):
+        """Ids of the ingredient sets with the given digests, creating the
+        missing ones (and their items)."""
+        if not items_by_digest:
+            return {}
+        set_ids = dict(
+            db.query(IngredientSet.digest, IngredientSet.id)
+            .filter(IngredientSet.digest.in_(list(items_by_digest)))
+        )
+        missing = [{"digest": digest} for digest in items_by_digest if digest not in set_ids]
+        if missing:
+            # Another writer may create the same set concurrently; only the
+            # rows actually inserted are returned, and get their items here
+            stmt = upsert_insert(db, IngredientSet.__table__).on_conflict_do_nothing(index_elements=["digest"])
+            created = dict(db.execute(stmt.returning(IngredientSet.digest, IngredientSet.id), missing).all())
+            if created:
+                db.execute(insert(IngredientSetItem), [
+                    {"set_id": set_id, "position": position, "ingredient_id": ingredient_id,
+                     "quantity": quantity, "unit": unit, "grams": grams}
+                    for digest, set_id in created.items()
+                    for position, (ingredient_id, quantity, unit, grams) in enumerate(items_by_digest[digest])
+                ])
+            set_ids.update(created)
+            if len(set_ids) < len(items_by_digest):
+                set_ids.update(
+                    db.query(IngredientSet.digest, IngredientSet.id)
+                    .filter(IngredientSet.digest.in_([d for d in items_by_digest if d not in set_ids]))
+                )
+        return set_ids
+
+    @staticmethod
+    def pin_unversioned_entries(db: Session):
+        """Point entries logged without a version at their recipe's current
+        one (backfill). The caller commits."""
+        return db.execute(
+            update(FoodEntry)
+            .where(FoodEntry.recipe_version_id.is_(None))
+            .values(recipe_version_id=select(Recipe.current_version_id)
+                    .where(Recipe.id == FoodEntry.recipe_id)
+                    .scalar_subquery())
+        ).rowcount
+
+    @staticmethod
+    def list_versions(db: Session, recipe_id: int):
+        return (
+            db.query(RecipeVersion)
+            .filter(RecipeVersion.recipe_id == recipe_id)
+            .order_by(RecipeVersion.version.desc())
+            .all()
+        )
+
+    @staticmethod
+    def get_version(db: Session, recipe_id: int, version: int):
+        return (
+            db.query(RecipeVersion)
+            .filter(RecipeVersion.recipe_id == recipe_id, RecipeVersion.version == version)
+            .first()
+        )
+
+def version_total_columns():
+    return [getattr(RecipeVersion, total_column(k)) for k in NUTRIENT_KEYS]
+
+# Rows fetched per round trip when GET /log streams entries
+STREAM_BATCH_SIZE = 500
+
+class LogService:
+    @staticmethod
+    def create_entry(db: Session, entry: FoodEntryCreate, user_id: int):
+        """Log an entry, or return None when the recipe isn't the user's."""
+        owned = (
+            db.query(Recipe.current_version_id)
+            .filter(Recipe.id == entry.recipe_id, Recipe.user_id == user_id)
+            .first()
+        )
+        if owned is None:
+            return None
+        db_entry = FoodEntry(**entry.dict(), user_id=user_id, recipe_version_id=owned.current_version_id)
+        db.add(db_entry)
+        db.flush()
+        RollupService.refresh_days(db, [(user_id, db_entry.date)])
+        db.commit()
+        db.refresh(db_entry)
+        return db_entry
+
+    @staticmethod
+    def create_entries(db: Session, entries: List[FoodEntryCreate], user_id: int):
+        """Insert many food entries in one transaction.
+
+        Recipe ids are validated with a single IN query; entries pointing at
+        unknown recipes (or another user's) are reported by index and the rest
+        are still inserted. created_ids follow the order of the inserted
+        entries in the request.
+        """
+        requested_ids = {entry.recipe_id for entry in entries}
+        # Recipe id -> current version, for the recipes the user owns
+        versions = dict(
+            db.query(Recipe.id, Recipe.current_version_id)
+            .filter(Recipe.id.in_(requested_ids), Recipe.user_id == user_id)
+        ) if requested_ids else {}
+
+        rows, errors = [], []
+        for index, entry in enumerate(entries):
+            if entry.recipe_id not in versions:
+                errors.append({"index": index, "detail": f"Recipe {entry.recipe_id} not found"})
+                continue
+            rows.append(dict(entry.dict(), user_id=user_id, recipe_version_id=versions[entry.recipe_id]))
+
+        created_ids = []
+        if rows:
+            created_ids = list(db.scalars(
+                insert(FoodEntry).returning(FoodEntry.id, sort_by_parameter_order=True), rows
+            ))
+            RollupService.refresh_days(db, {(user_id, row["date"]) for row in rows})
+        db.commit()
+        return {"created_ids": created_ids, "errors": errors}
+
+    @staticmethod
+    def entries_select(user_id: int, date: datetime.date = None, start: datetime.date = None,
+                       end: datetime.date = None):
+        """SELECT of a user's entries for one date or an inclusive start/end
+        range, oldest first."""
+        statement = select(FoodEntry).where(FoodEntry.user_id == user_id)
+        if date:
+            statement = statement.where(FoodEntry.date == date)
+        if start:
+            statement = statement.where(FoodEntry.date >= start)
+        if end:
+            statement = statement.where(FoodEntry.date <= end)
+        return statement.order_by(FoodEntry.date, FoodEntry.id)
+
+    @staticmethod
+    def list_entries(db: Session, user_id: int, date: datetime.date = None, start: datetime.date = None,
+                     end: datetime.date = None):
+        return db.scalars(LogService.entries_select(user_id, date, start, end)).all()
+
+    @staticmethod
+    def get_daily_summary(db: Session, user_id: int, date: datetime.date):
+        """Per-entry and total macros for one day in a single query.
+
+        Reads the totals of the recipe version each entry was logged against,
+        so no ingredient rows are touched and later recipe edits don't change
+        past days.
+        """
+        rows = (
+            db.query(
+                FoodEntry.id,
+                FoodEntry.recipe_id,
+                FoodEntry.serving_multiplier,
+                FoodEntry.nutrition_override,
+                RecipeVersion.name,
+                *version_total_columns(),
+            )
+            .join(RecipeVersion, FoodEntry.recipe_version_id == RecipeVersion.id)
+            .filter(FoodEntry.user_id == user_id, FoodEntry.date == date)
+            .order_by(FoodEntry.id)
+            .all()
+        )
+
+        nutrition = nutrition_engine.entry_totals(
+            nutrition_engine.as_matrix(row[5:] for row in rows),
+            [row.serving_multiplier for row in rows],
+            [row.nutrition_override for row in rows],
+        )
+        totals = nutrition.sum(axis=0)
+
+        entries = [
+            {
+                "id": row.id,
+                "recipe_id": row.recipe_id,
+                "recipe_name": row.name,
+                "serving_multiplier": row.serving_multiplier if row.serving_multiplier is not None else 1.0,
+                "nutrition": {k: round(float(v), 1) for k, v in zip(NUTRIENT_KEYS, values)},
+            }
+            for row, values in zip(rows, nutrition)
+        ]
+
+        return {
+            "date": date,
+            "entries": entries,
+            "totals": {k: round(float(v), 1) for k, v in zip(NUTRIENT_KEYS, totals)},
+        }
+
+class RollupService:
+    @staticmethod
+    def days_for_recipes(db: Session, recipe_ids):
+        """(user_id, date) of every day that logged one of the recipes."""
+        return [
+            tuple(row) for row in db.query(FoodEntry.user_id, FoodEntry.date)
+            .filter(FoodEntry.recipe_id.in_(list(recipe_ids)))
+            .distinct()
+        ]
+
+    @staticmethod
+    def refresh_days(db: Session, days):
+        """Recompute the daily_totals rows for the given (user_id, date) days
+        from their entries.
+
+        Costs one pass over those days' entries; the caller commits.
+        """
+        keys = {(user_id, d) for user_id, d in days if d is not None}
+        if not keys:
+            return
+        days = RollupService._accumulate(
+            RollupService._entry_rows(db).filter(tuple_(FoodEntry.user_id, FoodEntry.date).in_(keys))
+        )
+
+        db.query(DailyTotal).filter(
+            tuple_(DailyTotal.user_id, DailyTotal.date).in_(keys)
+        ).delete(synchronize_session=False)
+        if days:
+            db.execute(insert(DailyTotal), list(days.values()))
+        db.flush()
+
+    @staticmethod
+    def rebuild(db: Session):
+        """Recompute every rollup from scratch (backfill). Returns the day count."""
+        days = RollupService._accumulate(RollupService._entry_rows(db).yield_per(1000))
+
+        db.query(DailyTotal).delete(synchronize_session=False)
+        if days:
+            db.execute(insert(DailyTotal), list(days.values()))
+        db.commit()
+        return len(days)
+
+    @staticmethod
+    def _entry_rows(db: Session):
+        return (
+            db.query(
+                FoodEntry.user_id,
+                FoodEntry.date,
+                FoodEntry.serving_multiplier,
+                FoodEntry.nutrition_override,
+                *version_total_columns(),
+            )
+            .join(RecipeVersion, FoodEntry.recipe_version_id == RecipeVersion.id)
+        )
+
+    @staticmethod
+    def _accumulate(rows, chunk_size: int = 5000):
+        """Sum entry nutrition per (user_id, date), vectorized over chunks of rows."""
+        days = {}
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return days
+            nutrition = nutrition_engine.entry_totals(
+                nutrition_engine.as_matrix(row[4:] for row in chunk),
+                [row[2] for row in chunk],
+                [row[3] for row in chunk],
+            )
+            keys = [(row[0], row[1]) for row in chunk]
+            for (user_id, date), (count, sums) in nutrition_engine.group_sum(keys, nutrition).items():
+                day = days.setdefault((user_id, date), {
+                    "user_id": user_id, "date": date, "entry_count": 0, **dict.fromkeys(NUTRIENT_KEYS, 0.0)
+                })
+                day["entry_count"] += count
+                for k, v in zip(NUTRIENT_KEYS, sums.tolist()):
+                    day[k] += v
+
+    @staticmethod
+    def get_trends(db: Session, user_id: int, granularity: str = "day", start: datetime.date = None,
+                   end: datetime.date = None):
+        """A user's totals and per-logged-day averages bucketed by day, ISO
+        week or month.
+
+        Reads only daily_totals, so cost grows with the number of days.
+        """
+        query = db.query(DailyTotal).filter(DailyTotal.user_id == user_id)
+        if start:
+            query = query.filter(DailyTotal.date >= start)
+        if end:
+            query = query.filter(DailyTotal.date <= end)
+
+        buckets = {}
+        for day in query.order_by(DailyTotal.date):
+            if granularity == "week":
+                period_start = day.date - datetime.timedelta(days=day.date.weekday())
+            elif granularity == "month":
+                period_start = day.date.replace(day=1)
+            else:
+                period_start = day.date
+            bucket = buckets.setdefault(period_start, {
+                "period_start": period_start,
+                "days_logged": 0,
+                "entry_count": 0,
+                "totals": dict.fromkeys(NUTRIENT_KEYS, 0.0),
+            })
+            bucket["days_logged"] += 1
+            bucket["entry_count"] += day.entry_count
+            for k in NUTRIENT_KEYS:
+                bucket["totals"][k] += getattr(day, k) or 0.0
+
+        for bucket in buckets.values():
+            totals = bucket["totals"]
+            bucket["daily_average"] = {k: round(totals[k] / bucket["days_logged"], 1) for k in NUTRIENT_KEYS}
+            bucket["totals"] = {k: round(v, 1) for k, v in totals.items()}
+        return list(buckets.values())
@@ -0,0 +1,94 @@
+"""Unit table and conversions of ingredient quantities to grams.
+
+Mass units convert directly, volume units through the ingredient's density
+(water, 1 g/ml, when unknown) and count units through its piece weight.
+Conversions are resolved when recipe ingredients are written and stored in
+RecipeIngredient.grams, so reads only multiply by grams.
+"""
+from functools import lru_cache
+from typing import Optional
+
+# Grams per unit
+MASS_UNITS = {
+    "g": 1.0,
+    "gram": 1.0,
+    "gramme": 1.0,
+    "kg": 1000.0,
+    "kilogram": 1000.0,
+    "kilogramme": 1000.0,
+    "kilo": 1000.0,
+    "mg": 0.001,
+    "milligram": 0.001,
+    "oz": 28.349523125,
+    "ounce": 28.349523125,
+    "lb": 453.59237,
+    "pound": 453.59237,
+}
+
+# Millilitres per unit (US customary measures)
+VOLUME_UNITS = {
+    "ml": 1.0,
+    "millilitre": 1.0,
+    "milliliter": 1.0,
+    "cl": 10.0,
+    "dl": 100.0,
+    "l": 1000.0,
+    "litre": 1000.0,
+    "liter": 1000.0,
+    "tsp": 4.92892159375,
+    "teaspoon": 4.92892159375,
+    "tbsp": 14.78676478125,
+    "tablespoon": 14.78676478125,
+    "cup": 240.0,
+    "fl oz": 29.5735295625,
+    "fluid ounce": 29.5735295625,
+}
+
+# Converted through the ingredient's piece weight
+COUNT_UNITS = {"piece", "pc", "each", "whole", "item", "slice", "unit"}
+
+WATER_DENSITY_G_PER_ML = 1.0
+
+class UnitConversionError(ValueError):
+    pass
+
+def normalize_unit(unit: Optional[str]) -> str:
+    """Canonical spelling of a unit: lower case, no trailing dot or plural s.
+
+    A missing unit means grams, as quantities were always read as grams.
+    """
+    unit = " ".join((unit or "").lower().replace(".", " ").split())
+    if not unit:
+        return "g"
+    if unit in MASS_UNITS or unit in VOLUME_UNITS or unit in COUNT_UNITS:
+        return unit
+    for suffix in ("es", "s"):
+        singular = unit[:-len(suffix)]
+        if unit.endswith(suffix) and (singular in MASS_UNITS or singular in VOLUME_UNITS or singular in COUNT_UNITS):
+            return singular
+    return unit
+
+@lru_cache(maxsize=4096)
+def conversion_factor(unit: str, density_g_per_ml: Optional[float] = None,
+                      piece_weight_g: Optional[float] = None) -> float:
+    """Grams per one `unit` of an ingredient with the given density/piece weight.
+
+    Cached on the ingredient's conversion properties, so every (ingredient,
+    unit) pair is worked out once. Raises UnitConversionError when the unit
+    is unknown or a count unit is used without a piece weight.
+    """
+    unit = normalize_unit(unit)
+    if unit in MASS_UNITS:
+        return MASS_UNITS[unit]
+    if unit in VOLUME_UNITS:
+        return VOLUME_UNITS[unit] * (density_g_per_ml or WATER_DENSITY_G_PER_ML)
+    if unit in COUNT_UNITS:
+        if not piece_weight_g:
+            raise UnitConversionError(f"'{unit}' needs a piece weight (piece_weight_g) for this ingredient")
+        return piece_weight_g
+    raise UnitConversionError(f"Unknown unit '{unit}'")
+
+def to_grams(quantity: float, unit: str, ingredient) -> float:
+    """Quantity of an Ingredient row in `unit`, converted to grams."""
+    factor = conversion_factor(unit, ingredient.density_g_per_ml, ingredient.piece_weight_g)
+    return (quantity or 0.0) * factor
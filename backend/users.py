@@ -0,0 +1,31 @@
+"""Which user a request acts for.
+
+There is no login yet: clients (or an authenticating proxy in front of the
+API) name the user in the X-User-Id header, and requests without it act for
+DEFAULT_USER_ID, the owner of all data created before users existed.
+"""
+import threading
+from typing import Optional
+from fastapi import Header, HTTPException
+from .database import SessionLocal
+from .models import DEFAULT_USER_ID
+from .services import UserService
+
+# Users are never deleted, so an id seen once stays valid
+_known_user_ids = set()
+_known_user_ids_lock = threading.Lock()
+
+def get_user_id(x_user_id: Optional[int] = Header(None)) -> int:
+    user_id = DEFAULT_USER_ID if x_user_id is None else x_user_id
+    if user_id in _known_user_ids:
+        return user_id
+    db = SessionLocal()
+    try:
+        exists = UserService.get_user(db, user_id) is not None
+    finally:
+        db.close()
+    if not exists:
+        raise HTTPException(status_code=401, detail=f"Unknown user {user_id}")
+    with _known_user_ids_lock:
+        _known_user_ids.add(user_id)
+    return user_id
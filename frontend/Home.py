@@ -1,8 +1,6 @@
 import streamlit as st
 import datetime
-from api_client import get_daily_log, get_recipes, log_food
-import requests
-from api_client import API_URL
+from api_client import get_daily_summary, get_recipe_index, log_food, fetch_concurrently, render_debug_panel
 
 st.set_page_config(
     page_title="Nutrition Tracker", 
@@ -99,8 +97,19 @@ st.markdown("""
 st.title("🥦 Daily Food Logger")
 st.markdown("##### Track your nutrition journey, one meal at a time")
 
-# Fetch recipes once
-all_recipes = get_recipes()
+# The date picker below keeps its value in session state, so everything the
+# page needs is known up front: fetch the light recipe index (no ingredient
+# payloads) and both days' summaries in parallel. Summaries are cached per date.
+today_str = datetime.date.today().strftime("%Y-%m-%d")
+summary_dates = list(dict.fromkeys([
+    today_str,
+    st.session_state.get("selected_date", datetime.date.today()).strftime("%Y-%m-%d"),
+]))
+all_recipes, *fetched = fetch_concurrently(
+    (get_recipe_index,), *[(get_daily_summary, day) for day in summary_dates]
+)
+summaries = dict(zip(summary_dates, fetched))
+today_summary = summaries[today_str]
 
 # Sidebar content
 with st.sidebar:
@@ -108,27 +117,10 @@ with st.sidebar:
     st.markdown("")
     
     # Get today's stats
-    today_str = datetime.date.today().strftime("%Y-%m-%d")
-    today_logs = get_daily_log(today_str)
+    today_logs = today_summary['entries'] if today_summary else []
     
     if today_logs:
-        recipes = all_recipes
-        recipe_dict = {r['id']: r for r in recipes}
-        
-        total_kcal = 0
-        for entry in today_logs:
-            recipe = recipe_dict.get(entry['recipe_id'])
-            if recipe:
-                multiplier = entry['serving_multiplier']
-                if recipe['type'] == 'DIRECT':
-                    nut = recipe.get('nutrition_direct', {})
-                    total_kcal += nut.get('energy_kcal', 0) * multiplier
-                else:
-                    for ing_item in recipe.get('ingredients', []):
-                        ing = ing_item.get('ingredient', {})
-                        qty = ing_item['quantity']
-                        factor = qty / 100.0
-                        total_kcal += ing.get('energy_kcal_100g', 0) * factor * multiplier
+        total_kcal = today_summary['totals']['energy_kcal']
         
         st.markdown(f"""
             <div style='background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
@@ -162,7 +154,7 @@ with st.sidebar:
 # Date Selector
 col_date, col_spacer = st.columns([2, 3])
 with col_date:
-    selected_date = st.date_input("📅 Select Date", datetime.date.today())
+    selected_date = st.date_input("📅 Select Date", datetime.date.today(), key="selected_date")
 date_str = selected_date.strftime("%Y-%m-%d")
 
 st.markdown("---")
@@ -171,61 +163,23 @@ st.markdown("---")
 st.markdown("### 📊 Today's Intake")
 st.markdown("")
 
-if date_str == today_str:
-    logs = today_logs
-else:
-    logs = get_daily_log(date_str)
+summary = summaries[date_str] if date_str in summaries else get_daily_summary(date_str)
+logs = summary['entries'] if summary else []
 
 if logs:
-    total_kcal = 0
-    total_p = 0
-    total_c = 0
-    total_f = 0
-    
-    # Fetch all recipes to map nutrition
-    recipes = all_recipes
-    recipe_dict = {r['id']: r for r in recipes}
-    
     # Display each meal entry
     for idx, entry in enumerate(logs, 1):
-        recipe = recipe_dict.get(entry['recipe_id'])
-        if not recipe:
-            continue
-            
         multiplier = entry['serving_multiplier']
-        
-        # Calculate nutrition based on recipe type
-        if recipe['type'] == 'DIRECT':
-            nut = recipe.get('nutrition_direct', {})
-            kcal = nut.get('energy_kcal', 0) * multiplier
-            prot = nut.get('protein_g', 0) * multiplier
-            carb = nut.get('carbs_g', 0) * multiplier
-            fat = nut.get('fat_g', 0) * multiplier
-        else:
-            # For GRANULAR, sum up ingredients
-            kcal, prot, carb, fat = 0, 0, 0, 0
-            for ing_item in recipe.get('ingredients', []):
-                ing = ing_item.get('ingredient', {})
-                qty = ing_item['quantity']
-                factor = qty / 100.0
-                kcal += ing.get('energy_kcal_100g', 0) * factor
-                prot += ing.get('protein_g_100g', 0) * factor
-                carb += ing.get('carbs_g_100g', 0) * factor
-                fat += ing.get('fat_g_100g', 0) * factor
-            kcal *= multiplier
-            prot *= multiplier
-            carb *= multiplier
-            fat *= multiplier
-        
-        total_kcal += kcal
-        total_p += prot
-        total_c += carb
-        total_f += fat
+        nut = entry['nutrition']
+        kcal = nut['energy_kcal']
+        prot = nut['protein_g']
+        carb = nut['carbs_g']
+        fat = nut['fat_g']
         
         # Display meal card
         st.markdown(f"""
         <div class='meal-card'>
-            <h4 style='margin: 0 0 0.5rem 0;'>🍽️ {recipe['name']}</h4>
+            <h4 style='margin: 0 0 0.5rem 0;'>🍽️ {entry['recipe_name']}</h4>
             <p style='margin: 0; opacity: 0.7; font-size: 0.9rem;'>
                 {multiplier:.2f}x serving • 
                 {kcal:.0f} kcal • 
@@ -237,6 +191,12 @@ if logs:
         """, unsafe_allow_html=True)
     
     # Display totals
+    totals = summary['totals']
+    total_kcal = totals['energy_kcal']
+    total_p = totals['protein_g']
+    total_c = totals['carbs_g']
+    total_f = totals['fat_g']
+    
     st.markdown("")
     st.markdown("#### 📈 Daily Totals")
     tc1, tc2, tc3, tc4 = st.columns(4)
@@ -333,26 +293,11 @@ else:
         st.markdown("")
         st.markdown("#### 🔍 Nutrition Preview")
         
-        if recipe['type'] == 'DIRECT':
-            nut = recipe.get('nutrition_direct', {})
-            prev_kcal = nut.get('energy_kcal', 0) * multiplier
-            prev_p = nut.get('protein_g', 0) * multiplier
-            prev_c = nut.get('carbs_g', 0) * multiplier
-            prev_f = nut.get('fat_g', 0) * multiplier
-        else:
-            prev_kcal, prev_p, prev_c, prev_f = 0, 0, 0, 0
-            for ing_item in recipe.get('ingredients', []):
-                ing = ing_item.get('ingredient', {})
-                qty = ing_item['quantity']
-                factor = qty / 100.0
-                prev_kcal += ing.get('energy_kcal_100g', 0) * factor
-                prev_p += ing.get('protein_g_100g', 0) * factor
-                prev_c += ing.get('carbs_g_100g', 0) * factor
-                prev_f += ing.get('fat_g_100g', 0) * factor
-            prev_kcal *= multiplier
-            prev_p *= multiplier
-            prev_c *= multiplier
-            prev_f *= multiplier
+        nut = recipe.get('nutrition') or {}
+        prev_kcal = nut.get('energy_kcal', 0) * multiplier
+        prev_p = nut.get('protein_g', 0) * multiplier
+        prev_c = nut.get('carbs_g', 0) * multiplier
+        prev_f = nut.get('fat_g', 0) * multiplier
         
         pc1, pc2, pc3, pc4 = st.columns(4)
         pc1.metric("🔥 Calories", f"{prev_kcal:.0f}")
@@ -369,3 +314,4 @@ else:
             else:
                 st.error(f"❌ Failed to log meal: {res.text}")
 
+render_debug_panel()
@@ -1,27 +1,202 @@
 import requests
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-API_URL = "http://localhost:8000"
+API_URL = os.getenv("API_URL", "http://localhost:8000")
 
-@st.cache_data(ttl=300, show_spinner=False)
-def get_recipes():
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "3.05"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "30"))
+# Synchronous image analysis waits on the vision provider
+ANALYSIS_READ_TIMEOUT = float(os.getenv("ANALYSIS_READ_TIMEOUT", "180"))
+API_RETRIES = int(os.getenv("API_RETRIES", "3"))
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "10"))
+API_DEBUG = os.getenv("API_DEBUG", "false").lower() == "true"
+# User this frontend acts for; the backend's default user when unset
+API_USER_ID = os.getenv("API_USER_ID")
+# Backstop for log writes made outside this frontend process
+DAILY_LOG_TTL_SECONDS = int(os.getenv("DAILY_LOG_TTL_SECONDS", "300"))
+
+def _make_session():
+    # Only idempotent methods are retried (urllib3's default allowed_methods);
+    # a POST is retried on connection errors alone, before the request was sent
+    retry = Retry(
+        total=API_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    if API_USER_ID:
+        session.headers["X-User-Id"] = API_USER_ID
+    return session
+
+# One keep-alive connection pool for the whole frontend process
+_session = _make_session()
+
+# Most recent calls for the latency panel: (method, path, status, ms, bytes)
+_call_log = deque(maxlen=200)
+_call_log_lock = threading.Lock()
+
+def _request(method, path, timeout=None, **kwargs):
+    started = time.perf_counter()
+    status = "error"
+    size = 0
     try:
-        res = requests.get(f"{API_URL}/recipes")
-        return res.json() if res.status_code == 200 else []
+        res = _session.request(method, f"{API_URL}{path}",
+                               timeout=timeout or (API_CONNECT_TIMEOUT, API_READ_TIMEOUT), **kwargs)
+        status, size = res.status_code, len(res.content)
+        return res
+    finally:
+        with _call_log_lock:
+            _call_log.append((method, path, status, (time.perf_counter() - started) * 1000, size))
+
+# Shared by fetch_concurrently; sized to the connection pool
+_executor = ThreadPoolExecutor(max_workers=API_POOL_SIZE, thread_name_prefix="api")
+
+def fetch_concurrently(*calls):
+    """Run independent api_client calls in parallel and return their results
+    in order, e.g. fetch_concurrently((get_recipe_index,), (get_daily_summary, day)).
+
+    Calls run on worker threads, so they must not use Streamlit APIs.
+    """
+    futures = [_executor.submit(fn, *args) for fn, *args in calls]
+    return [future.result() for future in futures]
+
+def recent_calls():
+    with _call_log_lock:
+        return list(_call_log)
+
+def render_debug_panel():
+    """Per-call API latency in the sidebar, when API_DEBUG is set."""
+    if not API_DEBUG:
+        return
+    calls = recent_calls()
+    with st.sidebar.expander(f"🐢 API calls ({len(calls)})"):
+        if not calls:
+            st.caption("No calls yet")
+            return
+        latencies = sorted(ms for _, _, _, ms, _ in calls)
+        st.caption(
+            f"p50 {latencies[len(latencies) // 2]:.0f} ms • "
+            f"p95 {latencies[int(len(latencies) * 0.95)]:.0f} ms • max {latencies[-1]:.0f} ms"
+        )
+        st.dataframe(
+            [{"call": f"{m} {p}", "status": s, "ms": round(ms, 1), "bytes": b}
+             for m, p, s, ms, b in reversed(calls)],
+            hide_index=True,
+            use_container_width=True,
+        )
+        if st.button("Clear", key="api_debug_clear"):
+            with _call_log_lock:
+                _call_log.clear()
+
+RECIPE_PAGE_SIZE = 500
+
+# Last response per (path, params): (etag, body, next cursor). Catalog reads
+# are revalidated with If-None-Match and reuse the stored body on a 304.
+_etag_store = {}
+
+def _get_revalidated(path, params):
+    key = (path, tuple(sorted(params.items())))
+    stored = _etag_store.get(key)
+    headers = {"If-None-Match": stored[0]} if stored else {}
+    res = _request("GET", path, params=params, headers=headers)
+    if res.status_code == 304 and stored:
+        return stored[1], stored[2]
+    if res.status_code != 200:
+        return None, None
+    body, cursor = res.json(), res.headers.get("X-Next-Cursor")
+    if res.headers.get("ETag"):
+        _etag_store[key] = (res.headers["ETag"], body, cursor)
+    return body, cursor
+
+def _get_all_recipe_pages(params):
+    # Follow the X-Next-Cursor header until the last page
+    recipes = []
+    params = dict(params, limit=RECIPE_PAGE_SIZE)
+    while True:
+        page, cursor = _get_revalidated("/recipes", params)
+        if page is None:
+            return recipes
+        recipes.extend(page)
+        if not cursor:
+            return recipes
+        params["cursor"] = cursor
+
+def _recipe_filters(name_prefix, recipe_type):
+    params = {}
+    if name_prefix:
+        params["name_prefix"] = name_prefix
+    if recipe_type:
+        params["type"] = recipe_type
+    return params
+
+def get_recipes(name_prefix=None, recipe_type=None):
+    try:
+        return _get_all_recipe_pages(_recipe_filters(name_prefix, recipe_type))
+    except:
+        return []
+
+def get_recipe_index(name_prefix=None, recipe_type=None):
+    """Recipe summaries (serving info and cached nutrition, no ingredients)."""
+    try:
+        return _get_all_recipe_pages(dict(_recipe_filters(name_prefix, recipe_type), summary="true"))
     except:
         return []
 
 def clear_recipe_cache():
-    get_recipes.clear()
+    _etag_store.clear()
+
+# Daily log responses by (path, date): (fetched_at, body). Dropped for a date
+# when food is logged on it, and entirely when a recipe is deleted; recipe
+# edits keep them, as logged entries keep their recipe version.
+_daily_cache = {}
+_daily_cache_lock = threading.Lock()
+
+def _get_daily(path, date_str):
+    key = (path, date_str)
+    with _daily_cache_lock:
+        cached = _daily_cache.get(key)
+    if cached and time.monotonic() - cached[0] < DAILY_LOG_TTL_SECONDS:
+        return cached[1]
+    res = _request("GET", path, params={"date": date_str})
+    if res.status_code != 200:
+        return None
+    body = res.json()
+    with _daily_cache_lock:
+        _daily_cache[key] = (time.monotonic(), body)
+    return body
+
+def clear_daily_cache(date_str=None):
+    with _daily_cache_lock:
+        if date_str is None:
+            _daily_cache.clear()
+        else:
+            for key in [k for k in _daily_cache if k[1] == date_str]:
+                del _daily_cache[key]
 
 def get_daily_log(date_str):
     try:
-        res = requests.get(f"{API_URL}/log", params={"date": date_str})
-        return res.json() if res.status_code == 200 else []
+        return _get_daily("/log", date_str) or []
     except:
         return []
 
+def get_daily_summary(date_str):
+    try:
+        return _get_daily("/log/summary", date_str)
+    except:
+        return None
+
 def log_food(recipe_id, multiplier, date_str, override=None):
     payload = {
         "recipe_id": recipe_id,
@@ -29,20 +204,56 @@ def log_food(recipe_id, multiplier, date_str, override=None):
         "date": date_str,
         "nutrition_override": override
     }
-    return requests.post(f"{API_URL}/log", json=payload)
+    res = _request("POST", "/log", json=payload)
+    clear_daily_cache(date_str)
+    return res
 
 def analyze_image(image_file, mime_type):
     files = {"file": (image_file.name, image_file, mime_type)}
-    return requests.post(f"{API_URL}/analyze-image", files=files)
+    return _request("POST", "/analyze-image", files=files, timeout=(API_CONNECT_TIMEOUT, ANALYSIS_READ_TIMEOUT))
+
+def submit_image_analysis(image_file, mime_type):
+    files = {"file": (image_file.name, image_file, mime_type)}
+    return _request("POST", "/analyze-image", files=files, params={"mode": "job"})
+
+def get_image_analysis(job_id):
+    return _request("GET", f"/analyze-image/{job_id}")
 
 def create_recipe(data):
-    return requests.post(f"{API_URL}/recipes", json=data)
+    return _request("POST", "/recipes", json=data)
 
 def update_recipe(recipe_id, data):
-    return requests.put(f"{API_URL}/recipes/{recipe_id}", json=data)
+    # Logged entries keep the recipe version they were logged against, so
+    # cached days stay valid
+    return _request("PUT", f"/recipes/{recipe_id}", json=data)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def search_ingredients(query, limit=5):
+    """Existing ingredients ranked by similarity to query."""
+    try:
+        res = _request("GET", "/ingredients/search", params={"q": query, "limit": limit})
+        return res.json() if res.status_code == 200 else []
+    except:
+        return []
 
 def create_ingredient(data):
-    return requests.post(f"{API_URL}/ingredients", json=data)
+    return _request("POST", "/ingredients", json=data)
+
+def update_ingredient(ingredient_id, data):
+    # Recipes using the ingredient get new totals; logged days keep theirs
+    return _request("PUT", f"/ingredients/{ingredient_id}", json=data)
 
 def delete_recipe(recipe_id):
-    return requests.delete(f"{API_URL}/recipes/{recipe_id}")
+    res = _request("DELETE", f"/recipes/{recipe_id}")
+    clear_daily_cache()
+    return res
+
+def flatten_recipe(recipe_id):
+    return _request("POST", f"/recipes/{recipe_id}/flatten")
+
+def get_recipe_versions(recipe_id):
+    res = _request("GET", f"/recipes/{recipe_id}/versions")
+    return res.json() if res.status_code == 200 else []
+
+def restore_recipe_version(recipe_id, version):
+    return _request("POST", f"/recipes/{recipe_id}/versions/{version}/restore")
@@ -1,5 +1,9 @@
 import streamlit as st
-from api_client import analyze_image, create_recipe, clear_recipe_cache
+import time
+from api_client import submit_image_analysis, get_image_analysis, create_recipe, flatten_recipe, clear_recipe_cache, search_ingredients, render_debug_panel
+
+ANALYSIS_TIMEOUT_SECONDS = 120
+CONVERSION_HELP = "Only needed for count units (piece, slice) or volume units (ml, cup); 0 leaves it unset. Existing ingredients keep a value they already have."
 
 st.set_page_config(page_title="AI Import", page_icon="✨", layout="wide", initial_sidebar_state="expanded")
 
@@ -73,10 +77,21 @@ if uploaded_file:
         st.markdown("### 🔍 Analysis")
         if st.button("🚀 Analyze with AI", type="primary", use_container_width=True):
             with st.spinner("✨ Analyzing your meal..."):
-                res = analyze_image(uploaded_file, uploaded_file.type)
-                if res.status_code == 200:
-                    st.session_state.ai_draft = res.json()
+                res = submit_image_analysis(uploaded_file, uploaded_file.type)
+                job = res.json() if res.status_code == 202 else None
+                deadline = time.time() + ANALYSIS_TIMEOUT_SECONDS
+                while job and job['status'] in ("queued", "running") and time.time() < deadline:
+                    time.sleep(1)
+                    poll = get_image_analysis(job['id'])
+                    job = poll.json() if poll.status_code == 200 else None
+                
+                if job and job['status'] == "done":
+                    st.session_state.ai_draft = job['result']
                     st.success("✅ Analysis complete!")
+                elif job and job['status'] == "failed":
+                    st.error(f"❌ Analysis failed: {job['error']}")
+                elif job:
+                    st.error("❌ Analysis timed out, please try again.")
                 else:
                     st.error(f"❌ Analysis failed: {res.text}")
 
@@ -103,15 +118,25 @@ if st.session_state.ai_draft:
             i_name = c1.text_input(f"Name", value=ing['name'], key=f"name_{i}")
             i_qty = c2.number_input(f"Qty ({ing['unit']})", value=float(ing['quantity']), key=f"qty_{i}")
             i_unit = c3.text_input(f"Unit", value=ing['unit'], key=f"unit_{i}")
+
+            # Offer close matches so the recipe reuses existing ingredients
+            matches = [m['ingredient']['name'] for m in search_ingredients(ing['name']) if m['ingredient']['name'] != ing['name']]
+            if matches:
+                existing = c1.selectbox("Use existing ingredient", ["(new ingredient)"] + matches, key=f"match_{i}")
+                if existing != "(new ingredient)":
+                    i_name = existing
             
-            # Expose nutrition per 100g
-            with st.expander(f"📊 Nutrition per 100g for {i_name}"):
+            # Expose nutrition per 100g and the unit conversion properties
+            with st.expander(f"📊 Nutrition per 100g & unit conversion for {i_name}"):
                 nut = ing.get("nutrition_per_100g", {})
                 n1, n2, n3, n4 = st.columns(4)
                 i_kcal = n1.number_input(f"🔥 Kcal", value=float(nut.get("energy_kcal", 0.0)), key=f"kcal_{i}")
                 i_prot = n2.number_input(f"💪 Protein (g)", value=float(nut.get("protein_g", 0.0)), key=f"prot_{i}")
                 i_carb = n3.number_input(f"🌾 Carbs (g)", value=float(nut.get("carbs_g", 0.0)), key=f"carb_{i}")
                 i_fat = n4.number_input(f"🥑 Fat (g)", value=float(nut.get("fat_g", 0.0)), key=f"fat_{i}")
+                u1, u2 = st.columns(2)
+                i_piece = u1.number_input("⚖️ Grams per piece", value=0.0, min_value=0.0, key=f"piece_{i}", help=CONVERSION_HELP)
+                i_density = u2.number_input("💧 Density (g/ml)", value=0.0, min_value=0.0, key=f"density_{i}", help=CONVERSION_HELP)
             
             updated_ingredients.append({
                 "ingredient_name": i_name,
@@ -122,7 +147,9 @@ if st.session_state.ai_draft:
                     "protein_g": i_prot,
                     "carbs_g": i_carb,
                     "fat_g": i_fat
-                }
+                },
+                "piece_weight_g": i_piece or None,
+                "density_g_per_ml": i_density or None
             })
         
         # Optional Ingredients Section
@@ -149,14 +176,17 @@ if st.session_state.ai_draft:
                 opt_qty = c2.number_input(f"Qty", value=float(opt_ing['quantity']), key=f"opt_qty_{i}", min_value=0.0)
                 opt_unit = c3.text_input(f"Unit", value=opt_ing['unit'], key=f"opt_unit_{i}")
                 
-                # Expose nutrition per 100g
-                with st.expander(f"📊 Nutrition per 100g for {opt_ing['name']}"):
+                # Expose nutrition per 100g and the unit conversion properties
+                with st.expander(f"📊 Nutrition per 100g & unit conversion for {opt_ing['name']}"):
                     nut = opt_ing.get("nutrition_per_100g", {})
                     n1, n2, n3, n4 = st.columns(4)
                     opt_kcal = n1.number_input(f"🔥 Kcal", value=float(nut.get("energy_kcal", 0.0)), key=f"opt_kcal_{i}")
                     opt_prot = n2.number_input(f"💪 Protein (g)", value=float(nut.get("protein_g", 0.0)), key=f"opt_prot_{i}")
                     opt_carb = n3.number_input(f"🌾 Carbs (g)", value=float(nut.get("carbs_g", 0.0)), key=f"opt_carb_{i}")
                     opt_fat = n4.number_input(f"🥑 Fat (g)", value=float(nut.get("fat_g", 0.0)), key=f"opt_fat_{i}")
+                    u1, u2 = st.columns(2)
+                    opt_piece = u1.number_input("⚖️ Grams per piece", value=0.0, min_value=0.0, key=f"opt_piece_{i}", help=CONVERSION_HELP)
+                    opt_density = u2.number_input("💧 Density (g/ml)", value=0.0, min_value=0.0, key=f"opt_density_{i}", help=CONVERSION_HELP)
                 
                 # Only add to ingredients list if checked
                 if include_checkbox:
@@ -169,7 +199,9 @@ if st.session_state.ai_draft:
                             "protein_g": opt_prot,
                             "carbs_g": opt_carb,
                             "fat_g": opt_fat
-                        }
+                        },
+                        "piece_weight_g": opt_piece or None,
+                        "density_g_per_ml": opt_density or None
                     })
                 
                 st.markdown("")  # Add spacing between optional ingredients
@@ -192,9 +224,7 @@ if st.session_state.ai_draft:
                 recipe_id = res.json()['id']
                 if save_type.startswith("Direct"):
                     # Trigger flatten
-                    import requests
-                    from api_client import API_URL
-                    requests.post(f"{API_URL}/recipes/{recipe_id}/flatten")
+                    flatten_recipe(recipe_id)
                 
                 st.success("✅ Recipe saved successfully!")
                 st.session_state.ai_draft = None
@@ -203,3 +233,5 @@ if st.session_state.ai_draft:
                 st.rerun()
             else:
                 st.error(f"❌ Failed to save: {res.text}")
+
+render_debug_panel()
@@ -1,8 +1,7 @@
 import streamlit as st
-from api_client import get_recipes, create_recipe, update_recipe, delete_recipe, clear_recipe_cache
-import requests
+from api_client import get_recipes, create_recipe, update_recipe, update_ingredient, delete_recipe, flatten_recipe, get_recipe_versions, restore_recipe_version, clear_recipe_cache, render_debug_panel
 import pandas as pd
-from api_client import API_URL
+import datetime
 
 st.set_page_config(page_title="Recipe Manager", page_icon="📖", layout="wide", initial_sidebar_state="expanded")
 
@@ -83,7 +82,10 @@ st.markdown("##### Manage your recipes with ease")
 tab1, tab2 = st.tabs(["View & Edit", "Create New"])
 
 with tab1:
-    recipes = get_recipes()
+    fc1, fc2 = st.columns([3, 1])
+    name_filter = fc1.text_input("🔎 Filter by name", placeholder="Start typing a recipe name", key="recipe_name_filter")
+    type_filter = fc2.selectbox("📋 Type", ["All", "GRANULAR", "DIRECT"], key="recipe_type_filter")
+    recipes = get_recipes(name_filter.strip() or None, None if type_filter == "All" else type_filter)
     if not recipes:
         st.info("🔍 No recipes found. Create your first recipe in the **Create New** tab or use **AI Import**!")
     
@@ -101,6 +103,7 @@ with tab1:
             new_unit = c3.text_input("📏 Serving Unit", value=r['standard_serving_unit'], key=f"unit_{r['id']}")
             
             new_ingredients = []
+            ingredient_updates = {}
             new_kcal, new_prot, new_carb, new_fat = 0, 0, 0, 0
 
             st.markdown("")
@@ -115,18 +118,24 @@ with tab1:
                 new_fat = ec4.number_input("🥑 Fat (g)", value=float(n.get('fat_g', 0)), key=f"df_{r['id']}", min_value=0.0)
             else:
                 st.markdown("##### 🥗 Ingredients & Nutrition")
-                st.caption("Edit quantities and units directly in the table below")
+                st.caption("Edit quantities and units directly in the table below; units like piece or cup use the g / piece and g / ml columns, "
+                           "and changing a stored g / piece or g / ml updates that ingredient in every recipe")
                 
                 current_ingredients = r.get('ingredients', [])
                 
                 # Create a lookup map for nutrition to avoid passing objects through data_editor (which can stringify them)
                 # Key: Ingredient Name -> Value: Nutrition Dict
                 nut_lookup = {}
+                # (Ingredient Name, Unit) -> grams per unit, as resolved by the backend
+                grams_per_unit = {}
+                # Ingredient Name -> Ingredient, to send changed conversion values back
+                ingredient_rows = {}
                 
                 df_data = []
                 for item in current_ingredients:
                     ing = item.get('ingredient', {})
                     name = ing.get('name', '')
+                    ingredient_rows[name] = ing
                     
                     # Store 100g nutrition in map
                     nut_lookup[name] = {
@@ -137,13 +146,20 @@ with tab1:
                     }
                     
                     # Calculate per-row nutrition for initial display
-                    factor = float(item['quantity']) / 100.0
+                    grams = item.get('grams')
+                    if grams is None:
+                        grams = float(item['quantity'])
+                    if item['quantity']:
+                        grams_per_unit[(name, item['unit'])] = grams / float(item['quantity'])
+                    factor = grams / 100.0
                     nut_100g = nut_lookup[name]
 
                     df_data.append({
                         "Ingredient": name,
                         "Qty": float(item['quantity']),
                         "Unit": item['unit'],
+                        "g / piece": ing.get('piece_weight_g'),
+                        "g / ml": ing.get('density_g_per_ml'),
                         "Kcal": round(nut_100g['energy_kcal'] * factor), 
                         "Protein (g)": round(nut_100g['protein_g'] * factor, 1),
                         "Carbs (g)": round(nut_100g['carbs_g'] * factor, 1),
@@ -158,6 +174,11 @@ with tab1:
                         "Ingredient": st.column_config.TextColumn("Ingredient", disabled=True),
                         "Qty": st.column_config.NumberColumn("Qty", min_value=0.0, format="%.2f"),
                         "Unit": st.column_config.TextColumn("Unit"),
+                        # Filled in on the ingredient on save, or updated on it when changed; count units need g / piece
+                        "g / piece": st.column_config.NumberColumn("g / piece", min_value=0.0, format="%.1f",
+                                                                   help="Grams per piece, for units such as piece or slice"),
+                        "g / ml": st.column_config.NumberColumn("g / ml", min_value=0.0, format="%.2f",
+                                                                help="Density, for units such as ml or cup (water if empty)"),
                         "Kcal": st.column_config.NumberColumn("Kcal", disabled=True),
                         "Protein (g)": st.column_config.NumberColumn("Protein (g)", disabled=True),
                         "Carbs (g)": st.column_config.NumberColumn("Carbs (g)", disabled=True),
@@ -179,19 +200,35 @@ with tab1:
                     # Fallback if something weird happens and name is missing (shouldn't since disabled)
                     nut = nut_lookup.get(name, {"energy_kcal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0})
                     
-                    f = qty / 100.0
+                    # Units changed in the editor are converted by the backend on save
+                    f = qty * grams_per_unit.get((name, unit), 1.0) / 100.0
                     
                     t_kcal += float(nut.get('energy_kcal', 0) or 0) * f
                     t_p += float(nut.get('protein_g', 0) or 0) * f
                     t_c += float(nut.get('carbs_g', 0) or 0) * f
                     t_f += float(nut.get('fat_g', 0) or 0) * f
                     
+                    piece_weight = float(row['g / piece']) if pd.notna(row['g / piece']) and row['g / piece'] else None
+                    density = float(row['g / ml']) if pd.notna(row['g / ml']) and row['g / ml'] else None
                     new_ingredients.append({
                         "ingredient_name": name,
                         "quantity": qty,
                         "unit": unit,
-                        "nutrition_per_100g": nut
+                        "nutrition_per_100g": nut,
+                        "piece_weight_g": piece_weight,
+                        "density_g_per_ml": density
                     })
+
+                    # The recipe save only fills in missing values, so changed
+                    # stored ones are sent as an ingredient update
+                    ing = ingredient_rows.get(name)
+                    if ing and ((ing.get('piece_weight_g') and piece_weight != ing['piece_weight_g'])
+                                or (ing.get('density_g_per_ml') and density != ing['density_g_per_ml'])):
+                        ingredient_updates[name] = {
+                            **{k: v for k, v in ing.items() if k != 'id'},
+                            "piece_weight_g": piece_weight,
+                            "density_g_per_ml": density,
+                        }
                 
                 st.markdown("")
                 st.markdown("##### 📊 Live Nutrition Totals")
@@ -216,7 +253,12 @@ with tab1:
                     } if r['type'] == 'DIRECT' else None,
                     "ingredients": new_ingredients
                 }
-                res = update_recipe(r['id'], payload)
+                for ing_name, data in ingredient_updates.items():
+                    res = update_ingredient(ingredient_rows[ing_name]['id'], data)
+                    if res.status_code != 200:
+                        break
+                else:
+                    res = update_recipe(r['id'], payload)
                 if res.status_code == 200:
                     st.success("✅ Recipe updated successfully!")
                     clear_recipe_cache()
@@ -226,7 +268,7 @@ with tab1:
 
             if r['type'] == 'GRANULAR':
                 if ac2.button("🔄 Flatten to Direct", key=f"flat_{r['id']}"):
-                    requests.post(f"{API_URL}/recipes/{r['id']}/flatten")
+                    flatten_recipe(r['id'])
                     st.success("✅ Converted to Direct recipe!")
                     clear_recipe_cache()
                     st.rerun()
@@ -242,6 +284,27 @@ with tab1:
                 else:
                     st.error("❌ Failed to delete recipe.")
 
+            # Versions are only fetched once the history is opened
+            if st.checkbox("🕘 Show version history", key=f"hist_{r['id']}"):
+                versions = get_recipe_versions(r['id'])
+                for v in versions[1:]:
+                    vn = v.get('nutrition') or {}
+                    hc1, hc2 = st.columns([4, 1])
+                    hc1.markdown(
+                        f"**v{v['version']}** · {datetime.datetime.fromtimestamp(v['created_at']):%Y-%m-%d %H:%M} · "
+                        f"{v['name']} ({v['type']}) · 🔥 {vn.get('energy_kcal', 0):.0f} kcal"
+                    )
+                    if hc2.button("↩️ Restore", key=f"restore_{r['id']}_{v['version']}"):
+                        res = restore_recipe_version(r['id'], v['version'])
+                        if res.status_code == 200:
+                            st.success(f"✅ Restored version {v['version']}!")
+                            clear_recipe_cache()
+                            st.rerun()
+                        else:
+                            st.error(f"❌ Restore failed: {res.text}")
+                if len(versions) <= 1:
+                    st.caption("No earlier versions.")
+
 with tab2:
     st.markdown("##### ➕ Create New Recipe")
     st.markdown("")
@@ -289,3 +352,5 @@ with tab2:
         st.markdown("")
         st.info("💡 **Tip:** For Granular recipes, use the **AI Import** page for the best experience! Simply upload a photo and let AI identify ingredients and nutrition.")
         st.markdown("Manual granular creation requires selecting ingredients one by one, which is not yet fully implemented in this interface.")
+
+render_debug_panel()
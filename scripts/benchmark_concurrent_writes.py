@@ -0,0 +1,103 @@
+"""Concurrent-writer benchmark for the SQLite engine settings.
+
+Starts several processes (like multiple uvicorn workers) that each read the
+day's entries and then log a new one, committing every time. Runs once with
+the engine as it was before tuning (rollback journal, no busy timeout) and
+once with the app's tuned engine, and reports throughput, p99 commit latency
+and "database is locked" errors.
+
+Usage: python scripts/benchmark_concurrent_writes.py [--workers 8] [--writes 200]
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _configure(url: str, tuned: bool):
+    # Must run before backend.database is imported in this process
+    os.environ["DATABASE_URL"] = url
+    os.environ["SQLITE_TUNING"] = "true" if tuned else "false"
+    sys.path.insert(0, ROOT)
+
+def _baseline_sessionmaker(url: str):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    # No WAL and no busy timeout: a writer that finds the database locked
+    # fails straight away instead of waiting for its turn
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 0})
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _writer(url: str, tuned: bool, writes: int):
+    _configure(url, tuned)
+    from sqlalchemy.exc import OperationalError
+    from backend.models import FoodEntry
+    if tuned:
+        from backend.database import SessionLocal
+    else:
+        SessionLocal = _baseline_sessionmaker(url)
+
+    today = datetime.date.today()
+    latencies, locked = [], 0
+    for _ in range(writes):
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            db.query(FoodEntry).filter(FoodEntry.date == today).count()
+            db.add(FoodEntry(recipe_id=1, serving_multiplier=1.0, date=today))
+            db.commit()
+            latencies.append(time.perf_counter() - started)
+        except OperationalError as e:
+            db.rollback()
+            if "locked" not in str(e):
+                raise
+            locked += 1
+        finally:
+            db.close()
+    return latencies, locked
+
+def run(tuned: bool, workers: int, writes: int):
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        _configure(url, tuned)
+        context = multiprocessing.get_context("spawn")
+
+        with context.Pool(1) as setup:
+            setup.apply(_init_schema, (url, tuned))
+
+        started = time.perf_counter()
+        with context.Pool(workers) as pool:
+            results = pool.starmap(_writer, [(url, tuned, writes)] * workers)
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+    locked = sum(worker_locked for _, worker_locked in results)
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else float("nan")
+    label = "tuned (WAL, busy timeout)" if tuned else "before tuning"
+    print(f"{label:32} {len(latencies) / elapsed:8.0f} commits/s  "
+          f"median {statistics.median(latencies) * 1000 if latencies else float('nan'):7.1f} ms  "
+          f"p99 {p99 * 1000:7.1f} ms  locked errors {locked}")
+
+def _init_schema(url: str, tuned: bool):
+    _configure(url, tuned)
+    from backend.database import init_db
+    init_db()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=200, help="commits per worker")
+    args = parser.parse_args()
+
+    print(f"{args.workers} writer processes x {args.writes} commits")
+    run(False, args.workers, args.writes)
+    run(True, args.workers, args.writes)
+
+if __name__ == "__main__":
+    main()
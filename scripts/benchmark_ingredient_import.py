@@ -0,0 +1,68 @@
+"""Times a bulk ingredient import from a generated USDA-style fixture.
+
+Writes a CSV (or JSON Lines) file with one food per row and nutrient columns
+named by FoodData Central nutrient number, then imports it into a throwaway
+SQLite database with backend.ingredient_import and reports rows per second.
+Pass --keep to leave the fixture file behind for manual imports.
+
+Usage: python scripts/benchmark_ingredient_import.py [--rows 400000] [--format csv] [--batch-size 1000]
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("chicken beef pork salmon tuna rice oat wheat corn bean lentil pea milk cheese yogurt "
+         "butter egg apple banana orange grape tomato onion garlic potato carrot spinach kale "
+         "raw cooked boiled roasted fried dried frozen canned whole skim lean").split()
+
+def write_fixture(path: str, rows: int, fmt: str):
+    # Energy, protein, fat and carbohydrate by FDC legacy nutrient number
+    fields = ["description", "208", "203", "204", "205"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(fields)
+        for i in range(rows):
+            values = [f"{' '.join(random.sample(WORDS, 3))} {i}", round(random.uniform(0, 900), 1),
+                      round(random.uniform(0, 40), 2), round(random.uniform(0, 60), 2), round(random.uniform(0, 90), 2)]
+            if writer:
+                writer.writerow(values)
+            else:
+                f.write(json.dumps(dict(zip(fields, values))) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=400000)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--keep", action="store_true", help="keep the generated fixture")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    fixture = os.path.join(directory, f"foods.{args.format}")
+    started = time.perf_counter()
+    write_fixture(fixture, args.rows, args.format)
+    print(f"Wrote {args.rows:,} rows to {fixture} in {time.perf_counter() - started:.1f}s")
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    sys.path.insert(0, ROOT)
+    from backend.database import init_db
+    from backend.ingredient_import import import_ingredients
+
+    init_db()
+    stats = import_ingredients(fixture, batch_size=args.batch_size)
+    print(f"Imported {stats['upserted']:,} ingredients in {stats['elapsed']:.1f}s "
+          f"({stats['upserted'] / stats['elapsed']:,.0f} rows/s)")
+
+    if not args.keep:
+        os.remove(fixture)
+
+if __name__ == "__main__":
+    main()
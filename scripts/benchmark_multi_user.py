@@ -0,0 +1,129 @@
+"""Per-user read latency as the shared database grows.
+
+Seeds a throwaway SQLite database with many users, then grows it in stages:
+each stage gives every user more recipes and another month of food entries.
+After each stage a random sample of users is timed on the user-scoped reads
+the API serves (a recipe page, a daily summary, a month of entries and the
+weekly trends). With the (user_id, ...) composite indexes these stay flat
+while the total row count multiplies.
+
+Usage: python scripts/benchmark_multi_user.py [--users 10000] [--stages 4] [--sample 200]
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+START = datetime.date(2025, 1, 1)
+DAYS_PER_STAGE = 28
+
+def _seed_users(db, users: int):
+    from sqlalchemy import insert
+    from backend.models import User, DEFAULT_USER_ID
+
+    db.execute(insert(User), [{"id": DEFAULT_USER_ID + 1 + i, "name": f"user {i}"} for i in range(users)])
+    db.commit()
+    return list(range(DEFAULT_USER_ID + 1, DEFAULT_USER_ID + 1 + users))
+
+def _seed_stage(db, stage: int, user_ids, recipes_per_user: int, entries_per_user: int, next_recipe_id: int):
+    """Add recipes and one stage-long period of entries (plus rollups) for every user."""
+    from sqlalchemy import insert
+    from backend.models import Recipe, FoodEntry, DailyTotal, RecipeType
+    from backend.nutrients import NUTRIENT_KEYS, total_column
+    from backend.services import RecipeVersionService, RollupService
+
+    recipes, owned = [], {}
+    for user_id in user_ids:
+        owned[user_id] = range(next_recipe_id, next_recipe_id + recipes_per_user)
+        for recipe_id in owned[user_id]:
+            nutrition = {k: random.uniform(0, 500) for k in NUTRIENT_KEYS}
+            recipes.append({
+                "id": recipe_id, "user_id": user_id, "name": f"Recipe {recipe_id}", "type": RecipeType.DIRECT,
+                "nutrition_direct": nutrition, **{total_column(k): v for k, v in nutrition.items()},
+            })
+        next_recipe_id += recipes_per_user
+    db.execute(insert(Recipe), recipes)
+    for i in range(0, len(recipes), 1000):
+        RecipeVersionService.snapshot(db, [recipe["id"] for recipe in recipes[i:i + 1000]])
+
+    first_day = START + datetime.timedelta(days=stage * DAYS_PER_STAGE)
+    last_day = first_day + datetime.timedelta(days=DAYS_PER_STAGE - 1)
+    db.execute(insert(FoodEntry), [
+        {"user_id": user_id, "recipe_id": random.choice(owned[user_id]),
+         "serving_multiplier": random.choice([0.5, 1.0, 2.0]),
+         "date": first_day + datetime.timedelta(days=random.randrange(DAYS_PER_STAGE))}
+        for user_id in user_ids for _ in range(entries_per_user)
+    ])
+    RecipeVersionService.pin_unversioned_entries(db)
+
+    days = RollupService._accumulate(
+        RollupService._entry_rows(db).filter(FoodEntry.date.between(first_day, last_day)).yield_per(5000)
+    )
+    db.execute(insert(DailyTotal), list(days.values()))
+    db.commit()
+    return next_recipe_id, first_day, last_day
+
+def _time_reads(db, user_ids, first_day, last_day):
+    from backend.services import RecipeService, LogService, RollupService
+
+    reads = {
+        "recipe page (50)": lambda u: RecipeService.list_recipes(db, u, limit=50, with_ingredients=False),
+        "daily summary": lambda u: LogService.get_daily_summary(db, u, first_day + datetime.timedelta(days=3)),
+        "entries for the stage": lambda u: LogService.list_entries(db, u, start=first_day, end=last_day),
+        "weekly trends": lambda u: RollupService.get_trends(db, u, "week"),
+    }
+    results = {}
+    for label, read in reads.items():
+        latencies = []
+        for user_id in user_ids:
+            started = time.perf_counter()
+            read(user_id)
+            latencies.append((time.perf_counter() - started) * 1000)
+            db.expunge_all()
+        latencies.sort()
+        results[label] = (statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--stages", type=int, default=4)
+    parser.add_argument("--recipes-per-user", type=int, default=5)
+    parser.add_argument("--entries-per-user", type=int, default=30, help="Food entries per user per stage")
+    parser.add_argument("--sample", type=int, default=200, help="Users timed after each stage")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        sys.path.insert(0, ROOT)
+        from backend.database import SessionLocal, init_db
+        from backend.models import Recipe, FoodEntry
+
+        init_db()
+        db = SessionLocal()
+        try:
+            user_ids = _seed_users(db, args.users)
+            next_recipe_id = 1
+            for stage in range(args.stages):
+                started = time.perf_counter()
+                next_recipe_id, first_day, last_day = _seed_stage(
+                    db, stage, user_ids, args.recipes_per_user, args.entries_per_user, next_recipe_id
+                )
+                seeded = time.perf_counter() - started
+                print(f"Stage {stage + 1}: {db.query(Recipe).count()} recipes, "
+                      f"{db.query(FoodEntry).count()} entries across {len(user_ids)} users "
+                      f"(seeded in {seeded:.1f} s)")
+                sample = random.sample(user_ids, min(args.sample, len(user_ids)))
+                for label, (p50, p99) in _time_reads(db, sample, first_day, last_day).items():
+                    print(f"  {label:24} p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    main()
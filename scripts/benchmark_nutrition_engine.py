@@ -0,0 +1,116 @@
+"""Previous nutrition arithmetic vs the NumPy nutrition engine.
+
+Builds a throwaway SQLite database with many recipes and log entries, then
+times recomputing every recipe's totals (against the SQL aggregate the
+engine replaced) and rebuilding the daily rollups (against the previous
+per-row dict loop) with backend.nutrition_engine.
+
+Usage: python scripts/benchmark_nutrition_engine.py [--recipes 5000] [--entries 200000]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _seed(db, recipes: int, entries: int, ingredients: int = 500):
+    from sqlalchemy import insert
+    from backend.models import Ingredient, Recipe, RecipeIngredient, FoodEntry
+    from backend.nutrients import NUTRIENT_KEYS, per_100g_column
+    from backend.services import NutritionService, RecipeVersionService
+
+    db.execute(insert(Ingredient), [
+        {"name": f"Ingredient {i}", **{per_100g_column(k): random.uniform(0, 100) for k in NUTRIENT_KEYS}}
+        for i in range(ingredients)
+    ])
+    db.execute(insert(Recipe), [{"name": f"Recipe {i}"} for i in range(recipes)])
+    db.execute(insert(RecipeIngredient), [
+        {"recipe_id": r + 1, "ingredient_id": random.randint(1, ingredients),
+         "quantity": random.uniform(5, 300), "unit": "g"}
+        for r in range(recipes) for _ in range(random.randint(2, 12))
+    ])
+    start = datetime.date(2025, 1, 1)
+    db.execute(insert(FoodEntry), [
+        {"recipe_id": random.randint(1, recipes), "serving_multiplier": random.choice([0.5, 1.0, 2.0]),
+         "date": start + datetime.timedelta(days=random.randint(0, 364))}
+        for _ in range(entries)
+    ])
+    # Entries are read through the recipe version they were logged against
+    for first in range(1, recipes + 1, 1000):
+        NutritionService.refresh_totals_for_recipes(db, range(first, min(first + 1000, recipes + 1)))
+    RecipeVersionService.pin_unversioned_entries(db)
+    db.commit()
+
+def _sql_recipe_totals(db, recipe_ids):
+    from sqlalchemy import func
+    from backend.models import Ingredient, RecipeIngredient
+    from backend.nutrients import NUTRIENT_KEYS, per_100g_column
+
+    return (
+        db.query(
+            RecipeIngredient.recipe_id,
+            *[func.sum(getattr(Ingredient, per_100g_column(k)) * RecipeIngredient.quantity / 100.0)
+              for k in NUTRIENT_KEYS],
+        )
+        .join(Ingredient, RecipeIngredient.ingredient_id == Ingredient.id)
+        .filter(RecipeIngredient.recipe_id.in_(recipe_ids))
+        .group_by(RecipeIngredient.recipe_id)
+        .all()
+    )
+
+def _loop_rollups(rows):
+    from backend.nutrients import NUTRIENT_KEYS
+
+    days = {}
+    for user_id, date, multiplier, override, *recipe_totals in rows:
+        day = days.setdefault((user_id, date), {"entry_count": 0, **dict.fromkeys(NUTRIENT_KEYS, 0.0)})
+        day["entry_count"] += 1
+        per_serving = dict(zip(NUTRIENT_KEYS, (v or 0.0 for v in recipe_totals)))
+        if override:
+            per_serving.update({k: float(override[k] or 0) for k in NUTRIENT_KEYS if k in override})
+        for k in NUTRIENT_KEYS:
+            day[k] += per_serving[k] * (multiplier if multiplier is not None else 1.0)
+    return days
+
+def _timed(label, fn):
+    started = time.perf_counter()
+    fn()
+    print(f"  {label:28} {(time.perf_counter() - started) * 1000:9.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--entries", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        sys.path.insert(0, ROOT)
+        from backend.database import SessionLocal, init_db
+        from backend.models import Recipe
+        from backend import nutrition_engine
+        from backend.services import RollupService
+
+        init_db()
+        db = SessionLocal()
+        try:
+            _seed(db, args.recipes, args.entries)
+            recipe_ids = [row[0] for row in db.query(Recipe.id)]
+            rows = RollupService._entry_rows(db).all()
+
+            print(f"Recipe totals for {len(recipe_ids)} recipes")
+            _timed("SQL SUM ... GROUP BY", lambda: _sql_recipe_totals(db, recipe_ids))
+            _timed("nutrition_engine", lambda: nutrition_engine.recipe_totals(db, recipe_ids))
+
+            print(f"Daily rollups from {len(rows)} entries (rows already fetched)")
+            _timed("per-row loop", lambda: _loop_rollups(rows))
+            _timed("nutrition_engine", lambda: RollupService._accumulate(rows))
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    main()
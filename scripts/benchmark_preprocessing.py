@@ -0,0 +1,53 @@
+"""Benchmark the image pre-processing stage over a directory of images.
+
+Usage: python scripts/benchmark_preprocessing.py path/to/images [--max-dimension 1568] [--quality 85]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.image_processing import IMAGE_JPEG_QUALITY, IMAGE_MAX_DIMENSION, UnsupportedImageError, preprocess_image
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".heic", ".heif", ".webp"}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--max-dimension", type=int, default=IMAGE_MAX_DIMENSION)
+    parser.add_argument("--quality", type=int, default=IMAGE_JPEG_QUALITY)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.directory, name) for name in os.listdir(args.directory)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+    if not paths:
+        sys.exit(f"No images found in {args.directory}")
+
+    total_in = total_out = total_ms = processed = 0
+    print(f"{'file':40} {'original':>12} {'processed':>12} {'saved %':>8} {'ms':>8}")
+    for path in paths:
+        with open(path, "rb") as f:
+            try:
+                _, _, report = preprocess_image(f, max_dimension=args.max_dimension, quality=args.quality)
+            except UnsupportedImageError as e:
+                print(f"{os.path.basename(path)[:40]:40} skipped: {e}")
+                continue
+        saved = 100.0 * report["bytes_saved"] / report["original_bytes"] if report["original_bytes"] else 0.0
+        print(f"{os.path.basename(path)[:40]:40} {report['original_bytes']:>12} "
+              f"{report['processed_bytes']:>12} {saved:>7.1f}% {report['duration_ms']:>8.1f}")
+        total_in += report["original_bytes"]
+        total_out += report["processed_bytes"]
+        total_ms += report["duration_ms"]
+        processed += 1
+
+    if not processed:
+        sys.exit("No images could be processed")
+    print(f"\n{processed} images: {total_in} -> {total_out} bytes "
+          f"({100.0 * (total_in - total_out) / total_in:.1f}% saved), "
+          f"{total_ms / processed:.1f} ms/image")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Concurrent read/write load test for the sync and async database paths.
+
+Starts uvicorn twice on a fresh SQLite database, once with DB_ASYNC=false and
+once with DB_ASYNC=true, seeds a few recipes, then has concurrent clients mix
+GET /recipes, GET /log and POST /log. Reports requests/s and p99 latency.
+
+Usage: python scripts/load_test.py [--clients 50] [--requests 20]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _start_server(db_path: str, use_async: bool, port: int):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", DB_ASYNC="true" if use_async else "false")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+
+async def _wait_ready(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            await client.get("/ingredients")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+async def _seed(client: httpx.AsyncClient):
+    for i in range(20):
+        response = await client.post("/recipes", json={
+            "name": f"Load Recipe {i}",
+            "type": "GRANULAR",
+            "ingredients": [
+                {"ingredient_name": f"Load Ingredient {i % 5}", "quantity": 100, "unit": "g",
+                 "nutrition_per_100g": {"energy_kcal": 100, "protein_g": 5, "carbs_g": 10, "fat_g": 3}},
+                {"ingredient_name": f"Load Ingredient {(i + 1) % 5}", "quantity": 50, "unit": "g"},
+            ],
+        })
+        response.raise_for_status()
+
+async def _client(client: httpx.AsyncClient, requests: int, latencies: list, errors: list):
+    today = datetime.date.today().isoformat()
+    for _ in range(requests):
+        roll = random.random()
+        started = time.perf_counter()
+        if roll < 0.4:
+            response = await client.get("/recipes", params={"limit": 50})
+        elif roll < 0.7:
+            response = await client.get("/log", params={"date": today})
+        else:
+            response = await client.post("/log", json={
+                "recipe_id": random.randint(1, 20), "serving_multiplier": 1.0, "date": today
+            })
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+
+async def _drive(port: int, clients: int, requests: int):
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        await _wait_ready(client)
+        await _seed(client)
+        latencies, errors = [], []
+        started = time.perf_counter()
+        await asyncio.gather(*(_client(client, requests, latencies, errors) for _ in range(clients)))
+        return latencies, errors, time.perf_counter() - started
+
+def run(use_async: bool, clients: int, requests: int):
+    with tempfile.TemporaryDirectory() as directory:
+        port = _free_port()
+        server = _start_server(os.path.join(directory, "load.db"), use_async, port)
+        try:
+            latencies, errors, elapsed = asyncio.run(_drive(port, clients, requests))
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    label = "async (DB_ASYNC=true)" if use_async else "sync (threadpool)"
+    print(f"{label:24} {len(latencies) / elapsed:8.0f} req/s  p99 {p99 * 1000:7.1f} ms  errors {len(errors)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    args = parser.parse_args()
+
+    print(f"{args.clients} concurrent clients x {args.requests} requests")
+    run(False, args.clients, args.requests)
+    run(True, args.clients, args.requests)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before backend modules read their config
+_tmpdir = tempfile.mkdtemp(prefix="nutrition-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'nutrition.db')}")
+os.environ.setdefault("AI_PROVIDER", "fake")
@@ -0,0 +1,68 @@
+"""Recipe reads must issue a fixed number of statements however many recipes
+(and ingredients) they return, i.e. no per-row lazy loads."""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from backend.database import engine
+from backend.main import app
+
+def _recipe(name: str, ingredient_count: int) -> dict:
+    return {
+        "name": name,
+        "type": "GRANULAR",
+        "ingredients": [
+            {
+                "ingredient_name": f"{name} ingredient {i}",
+                "quantity": 10 + i,
+                "unit": "g",
+                "nutrition_per_100g": {"energy_kcal": 100, "protein_g": 5, "carbs_g": 10, "fat_g": 2},
+            }
+            for i in range(ingredient_count)
+        ],
+    }
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+def _new_user(client, name: str, recipe_count: int, ingredient_count: int):
+    user_id = client.post("/users", json={"name": name}).json()["id"]
+    headers = {"X-User-Id": str(user_id)}
+    recipe_ids = []
+    for i in range(recipe_count):
+        r = client.post("/recipes", json=_recipe(f"{name} recipe {i}", ingredient_count), headers=headers)
+        assert r.status_code == 200, r.text
+        recipe_ids.append(r.json()["id"])
+    return headers, recipe_ids
+
+def _count_statements(client, path: str, headers: dict) -> int:
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        r = client.get(path, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert r.status_code == 200, r.text
+    return len(statements)
+
+def test_list_recipes_statement_count_is_constant(client):
+    one_headers, _ = _new_user(client, "one", recipe_count=1, ingredient_count=3)
+    many_headers, _ = _new_user(client, "many", recipe_count=30, ingredient_count=3)
+
+    one = _count_statements(client, "/recipes", one_headers)
+    many = _count_statements(client, "/recipes", many_headers)
+    assert many == one
+
+def test_get_recipe_statement_count_is_constant(client):
+    headers, _ = _new_user(client, "detail", recipe_count=0, ingredient_count=0)
+    small_id = client.post("/recipes", json=_recipe("small", 1), headers=headers).json()["id"]
+    large_id = client.post("/recipes", json=_recipe("large", 30), headers=headers).json()["id"]
+
+    small = _count_statements(client, f"/recipes/{small_id}", headers)
+    large = _count_statements(client, f"/recipes/{large_id}", headers)
+    assert large == small